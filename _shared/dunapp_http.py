@@ -0,0 +1,289 @@
+"""
+Shared HTTP Fetch Layer for the Python Collectors
+
+Used by aszalymonitoring-mcp/server.py, talajviz/talajviz_scraper_supabase.py
+and talajvizkutak/talajviz_kutak_cached.py, so connection pooling, rate
+limits, retries and caching are configured in one place:
+
+- Connection pooling + keep-alive per host (one requests.Session per process)
+- Per-host rate limits shared by all processes on the machine (token bucket in a
+  flock-protected state file; per process only where fcntl is unavailable, i.e.
+  Windows). Processes on different machines are not coordinated.
+- Consistent retry / exponential backoff (urllib3 Retry, honours Retry-After)
+- Optional on-disk response cache (opt-in per call or via environment)
+- Async wrappers (aget / apost) that run the pooled sync client in a thread
+
+Environment overrides:
+    DUNAPP_HTTP_RATE_DIR    rate limit state directory (default: <tmp>/dunapp_http_rate)
+    DUNAPP_HTTP_CACHE_DIR   enable the on-disk cache in this directory
+    DUNAPP_HTTP_CACHE_TTL   default cache TTL in seconds (default: 3600)
+    DUNAPP_HTTP_RETRIES     retry count (default: 3)
+
+Usage:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "_shared"))
+    from dunapp_http import get_client
+
+    response = get_client().get(url, timeout=15)
+    response = await get_client().aget(url)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+try:
+    import fcntl
+except ImportError:  # Windows: rate limit buckets are per process
+    fcntl = None
+
+USER_AGENT = "DunApp-Collector/1.0 (+https://github.com/endresztellik-gif/DunApp)"
+DEFAULT_TIMEOUT = 15
+DEFAULT_RETRIES = int(os.getenv("DUNAPP_HTTP_RETRIES", "3"))
+DEFAULT_BACKOFF = 0.5  # 0.5s, 1s, 2s, ...
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+POOL_MAXSIZE = 10
+
+# Requests per second per host, for all processes on the machine together (burst = 1 second's worth)
+HOST_RATE_LIMITS: Dict[str, float] = {
+    "www.vizugy.hu": 2.0,
+    "aszalymonitoring.vizugy.hu": 5.0,
+    "vizadat.hu": 5.0,
+}
+
+RATE_STATE_DIR = os.getenv("DUNAPP_HTTP_RATE_DIR", os.path.join(tempfile.gettempdir(), "dunapp_http_rate"))
+CACHE_DIR = os.getenv("DUNAPP_HTTP_CACHE_DIR")
+CACHE_TTL = int(os.getenv("DUNAPP_HTTP_CACHE_TTL", "3600"))
+
+
+class RateLimiter:
+    """
+    Token bucket per host, shared by every process on this machine.
+
+    The bucket state (tokens, last refill time) lives in a small file per host
+    under RATE_STATE_DIR and is updated under an exclusive flock, so e.g. the
+    scraper's --workers pool, a concurrent backfill and the MCP server together
+    stay within one host's limit. Without fcntl (Windows) the bucket falls back
+    to one per process.
+    """
+
+    def __init__(self, limits: Dict[str, float], state_dir: Optional[str] = RATE_STATE_DIR):
+        self.limits = dict(limits)
+        self.state_dir = state_dir if fcntl is not None else None
+        self._buckets: Dict[str, list] = {}  # in-process fallback: host -> [tokens, last_refill]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _take(state: Optional[list], rate: float, now: float) -> Tuple[list, float]:
+        """Refill and try to take one token. Returns (new state, seconds to wait; 0 = taken)."""
+        tokens, last = state if state else (rate, now)
+        tokens = min(rate, tokens + max(0.0, now - last) * rate)
+        if tokens >= 1:
+            return [tokens - 1, now], 0.0
+        return [tokens, now], (1 - tokens) / rate
+
+    def _take_shared(self, host: str, rate: float) -> float:
+        os.makedirs(self.state_dir, exist_ok=True)
+        fd = os.open(os.path.join(self.state_dir, f"{host}.bucket"), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                state = [float(v) for v in os.pread(fd, 64, 0).split()] or None
+            except ValueError:
+                state = None
+            state, wait = self._take(state, rate, time.time())  # wall clock: comparable across processes
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, f"{state[0]:.6f} {state[1]:.6f}".encode(), 0)
+            return wait
+        finally:
+            os.close(fd)  # releases the flock
+
+    def acquire(self, host: str):
+        """Block until a request to `host` is allowed (no-op for unlimited hosts)."""
+        rate = self.limits.get(host)
+        if not rate:
+            return
+
+        while True:
+            if self.state_dir:
+                try:
+                    wait = self._take_shared(host, rate)
+                except OSError:
+                    self.state_dir = None  # state dir not writable (e.g. owned by another user): per process
+                    continue
+            else:
+                with self._lock:
+                    self._buckets[host], wait = self._take(self._buckets.get(host), rate, time.monotonic())
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class ResponseCache:
+    """On-disk cache of successful responses (body + status + headers), with TTL."""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(method: str, url: str, params=None, data=None) -> str:
+        raw = json.dumps([method.upper(), url, params, data], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str, ttl: int) -> Optional[requests.Response]:
+        meta_path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if time.time() - meta["stored_at"] > ttl:
+                return None
+            with open(os.path.join(self.cache_dir, f"{key}.body"), "rb") as f:
+                body = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+        response = requests.Response()
+        response.status_code = meta["status"]
+        response.headers = CaseInsensitiveDict(meta["headers"])
+        response.url = meta["url"]
+        response.encoding = meta.get("encoding")
+        response._content = body
+        return response
+
+    def put(self, key: str, response: requests.Response):
+        # Body first, metadata last (atomic replace) - a half-written entry is never served
+        body_path = os.path.join(self.cache_dir, f"{key}.body")
+        meta_path = os.path.join(self.cache_dir, f"{key}.json")
+        suffix = f".tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(body_path + suffix, "wb") as f:
+            f.write(response.content)
+        os.replace(body_path + suffix, body_path)
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump({
+                "status": response.status_code,
+                "headers": dict(response.headers),
+                "url": response.url,
+                "encoding": response.encoding,
+                "stored_at": time.time(),
+            }, f)
+        os.replace(meta_path + suffix, meta_path)
+
+
+class HttpClient:
+    """
+    Pooled HTTP client with per-host rate limits, retries and optional disk cache.
+
+    Prefer get_client() over instantiating this directly, so every collector
+    in the process shares the same connection pool and rate limiter.
+    """
+
+    def __init__(
+        self,
+        timeout: float = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        rate_limits: Optional[Dict[str, float]] = None,
+        cache_dir: Optional[str] = CACHE_DIR,
+        cache_ttl: int = CACHE_TTL,
+    ):
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.rate_limiter = RateLimiter(HOST_RATE_LIMITS if rate_limits is None else rate_limits)
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=None,  # POST is read-only on the APIs we call (e.g. aszalymonitoring getmeas)
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=len(HOST_RATE_LIMITS) + 2, pool_maxsize=POOL_MAXSIZE,
+                              max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, url: str, cache: Optional[bool] = None,
+                cache_ttl: Optional[int] = None, **kwargs) -> requests.Response:
+        """
+        Send a request through the pool.
+
+        Args:
+            cache: use the disk cache for this call (default: only for GET when a
+                cache directory is configured). Conditional requests
+                (If-None-Match / If-Modified-Since) are never served from cache.
+            cache_ttl: override the default TTL (seconds)
+        """
+        headers = kwargs.get("headers") or {}
+        conditional = "If-None-Match" in headers or "If-Modified-Since" in headers
+        use_cache = self.cache is not None and not conditional and (
+            cache if cache is not None else method.upper() == "GET"
+        )
+
+        key = None
+        if use_cache:
+            key = ResponseCache.key(method, url, kwargs.get("params"), kwargs.get("data") or kwargs.get("json"))
+            cached = self.cache.get(key, cache_ttl if cache_ttl is not None else self.cache_ttl)
+            if cached is not None:
+                return cached
+
+        self.rate_limiter.acquire(urlparse(url).hostname or "")
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method, url, **kwargs)
+
+        if use_cache and response.status_code == 200:
+            self.cache.put(key, response)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    async def arequest(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Async variant: runs the pooled request in a worker thread."""
+        return await asyncio.to_thread(self.request, method, url, **kwargs)
+
+    async def aget(self, url: str, **kwargs) -> requests.Response:
+        return await self.arequest("GET", url, **kwargs)
+
+    async def apost(self, url: str, **kwargs) -> requests.Response:
+        return await self.arequest("POST", url, **kwargs)
+
+
+_client: Optional[HttpClient] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """
+    Process-wide shared client.
+
+    A new client is created after fork (e.g. multiprocessing workers), because
+    pooled sockets must not be shared between processes.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = HttpClient()
+            _client_pid = os.getpid()
+        return _client
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3.11
+"""
+Groundwater vs. Drought Correlation Engine
+
+Aligns groundwater well levels (talajviz scraper output) with nearby
+aszalymonitoring station series (precipitation, soil moisture, HDI, ...) on a
+common daily grid, pairs every well with its nearest drought stations and
+computes lagged correlations / response times for all pairs in one batch.
+
+Aligned matrices are cached on disk, so repeated analyses don't re-fetch the
+drought API.
+
+Usage:
+    python3.11 correlation.py --days 180 --max-lag 60 --nearest 2
+    python3.11 correlation.py --params precipitation,drought_index --format json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from groundwater import GROUNDWATER_CSV, WELLS
+from server import LOCATIONS, PARAM_IDS, fetch_measurements_from_api
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, ".cache")
+
+DEFAULT_PARAMS = ["precipitation", "soil_moisture_10cm", "drought_index"]
+
+# Hourly measured parameters are summed (precipitation) or averaged per day.
+# Days without any reading stay NaN (sum uses min_count=1), so they don't count as samples.
+DAILY_AGGREGATION = {
+    "precipitation": "sum",
+}
+
+
+def haversine_matrix(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Great-circle distances (km) between every point of set 1 (rows) and set 2 (columns)."""
+    lat1, lon1 = np.radians(lat1)[:, None], np.radians(lon1)[:, None]
+    lat2, lon2 = np.radians(lat2)[None, :], np.radians(lon2)[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * np.arcsin(np.sqrt(a))
+
+
+def nearest_stations(well_codes: List[str], k: int) -> List[Tuple[str, str, float]]:
+    """
+    Pair each well with its k nearest drought monitoring stations.
+
+    Returns:
+        [(well_code, station_name, distance_km), ...]
+    """
+    stations = list(LOCATIONS.keys())
+    dist = haversine_matrix(
+        np.array([WELLS[c]["lat"] for c in well_codes]),
+        np.array([WELLS[c]["lon"] for c in well_codes]),
+        np.array([LOCATIONS[s]["lat"] for s in stations]),
+        np.array([LOCATIONS[s]["lon"] for s in stations]),
+    )
+    k = min(k, len(stations))
+    order = np.argsort(dist, axis=1)[:, :k]
+    return [
+        (code, stations[j], float(dist[i, j]))
+        for i, code in enumerate(well_codes)
+        for j in order[i]
+    ]
+
+
+def load_groundwater_daily(csv_path: str = GROUNDWATER_CSV) -> pd.DataFrame:
+    """
+    Load the scraper's CSV backup as a daily matrix (index: date, columns: well code).
+
+    Older backups use a "datum" column instead of "timestamp".
+    """
+    df = pd.read_csv(csv_path, dtype={"torzsszam": str})
+    time_col = "timestamp" if "timestamp" in df.columns else "datum"
+    df["date"] = pd.to_datetime(df[time_col].astype(str).str[:10])
+    df["vizszint"] = pd.to_numeric(df["vizszint"], errors="coerce")
+    return df.pivot_table(index="date", columns="torzsszam", values="vizszint", aggfunc="mean")
+
+
+def fetch_drought_daily(stations: List[str], params: List[str], days: int) -> pd.DataFrame:
+    """
+    Fetch drought series and resample them to daily values.
+
+    Returns:
+        DataFrame (index: date, columns: MultiIndex (station, param))
+    """
+    columns = {}
+    for station in stations:
+        statid = LOCATIONS[station]["uuid"]
+        for param in params:
+            data = fetch_measurements_from_api(statid, PARAM_IDS[param], days_back=days) or []
+            if not data:
+                continue
+            series = pd.Series(
+                pd.to_numeric([m.get("value") for m in data], errors="coerce"),
+                index=pd.to_datetime([m.get("date") for m in data], errors="coerce"),
+            )
+            series = series[series.index.notna()]
+            daily = series.resample("D")
+            if DAILY_AGGREGATION.get(param, "mean") == "sum":
+                columns[(station, param)] = daily.sum(min_count=1)
+            else:
+                columns[(station, param)] = daily.mean()
+
+    if not columns:
+        return pd.DataFrame(columns=pd.MultiIndex.from_tuples([], names=["station", "param"]))
+    frame = pd.DataFrame(columns)
+    frame.columns = pd.MultiIndex.from_tuples(frame.columns, names=["station", "param"])
+    return frame
+
+
+def _cache_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def align_sources(
+    params: List[str],
+    days: int,
+    nearest: int,
+    csv_path: str = GROUNDWATER_CSV,
+    use_cache: bool = True,
+) -> Dict:
+    """
+    Build the aligned daily matrices for all well/station pairs.
+
+    Returns:
+        {
+          "dates": DatetimeIndex (T),
+          "groundwater": ndarray (T x W), "wells": [well_code, ...],
+          "drought": ndarray (T x S), "series": [(station, param), ...],
+          "pairs": [(well_code, station, distance_km), ...]
+        }
+    """
+    stat = os.stat(csv_path)
+    today = datetime.now().strftime("%Y-%m-%d")
+    key = _cache_key(params, days, nearest, os.path.abspath(csv_path), stat.st_size, stat.st_mtime, today)
+    cache_path = os.path.join(CACHE_DIR, f"aligned_{key}.npz")
+
+    if use_cache and os.path.exists(cache_path):
+        with np.load(cache_path, allow_pickle=False) as npz:
+            meta = json.loads(str(npz["meta"]))
+            return {
+                "dates": pd.to_datetime(npz["dates"]),
+                "groundwater": npz["groundwater"],
+                "wells": meta["wells"],
+                "drought": npz["drought"],
+                "series": [tuple(s) for s in meta["series"]],
+                "pairs": [tuple(p) for p in meta["pairs"]],
+            }
+
+    groundwater = load_groundwater_daily(csv_path)
+    wells = [c for c in groundwater.columns if c in WELLS]
+    pairs = nearest_stations(wells, nearest)
+    stations = sorted({station for _, station, _ in pairs})
+    drought = fetch_drought_daily(stations, params, days)
+
+    # Common daily grid over the requested window
+    end = pd.Timestamp(today)
+    grid = pd.date_range(end - pd.Timedelta(days=days - 1), end, freq="D")
+    gw = groundwater[wells].reindex(grid)
+    dr = drought.reindex(grid)
+
+    aligned = {
+        "dates": grid,
+        "groundwater": gw.to_numpy(dtype=np.float64),
+        "wells": wells,
+        "drought": dr.to_numpy(dtype=np.float64),
+        "series": [tuple(c) for c in dr.columns],
+        "pairs": pairs,
+    }
+
+    # A failed API call returns None and the series is simply absent: don't cache
+    # the incomplete matrix, so the next run fetches it again
+    fetched = set(aligned["series"])
+    missing = [(station, param) for station in stations for param in params if (station, param) not in fetched]
+    if missing:
+        print(f"Warning: no data for {', '.join(f'{s}/{p}' for s, p in missing)} - aligned matrix not cached",
+              file=sys.stderr)
+
+    if use_cache and not missing:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        meta = {"wells": wells, "series": aligned["series"], "pairs": pairs}
+        np.savez_compressed(
+            cache_path,
+            dates=grid.to_numpy(dtype="datetime64[ns]"),
+            groundwater=aligned["groundwater"],
+            drought=aligned["drought"],
+            meta=np.array(json.dumps(meta)),
+        )
+    return aligned
+
+
+def lagged_correlations(gw: np.ndarray, dr: np.ndarray, max_lag: int, min_overlap: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    NaN-aware Pearson correlation for many column pairs at once.
+
+    gw[:, p] is correlated with dr[:, p] shifted forward by each lag (the drought
+    series leads): r[lag, p] = corr(gw[lag:, p], dr[:T-lag, p]).
+
+    Returns:
+        (r: ndarray (max_lag+1 x P), n: overlapping sample counts, same shape)
+    """
+    T, P = gw.shape
+    r = np.full((max_lag + 1, P), np.nan)
+    n = np.zeros((max_lag + 1, P), dtype=np.int64)
+
+    for lag in range(min(max_lag, T - 1) + 1):
+        a = gw[lag:]
+        b = dr[:T - lag]
+        mask = ~(np.isnan(a) | np.isnan(b))
+        count = mask.sum(axis=0)
+        a0 = np.where(mask, a, 0.0)
+        b0 = np.where(mask, b, 0.0)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_a = a0.sum(axis=0) / count
+            mean_b = b0.sum(axis=0) / count
+            da = np.where(mask, a - mean_a, 0.0)
+            db = np.where(mask, b - mean_b, 0.0)
+            cov = (da * db).sum(axis=0)
+            denom = np.sqrt((da ** 2).sum(axis=0) * (db ** 2).sum(axis=0))
+            r_lag = cov / denom
+
+        r[lag] = np.where((count >= min_overlap) & (denom > 0), r_lag, np.nan)
+        n[lag] = count
+
+    return r, n
+
+
+def correlate(aligned: Dict, max_lag: int) -> pd.DataFrame:
+    """
+    Lagged correlations and response times for every (well, station, param) pair.
+
+    The response time is the lag (days) with the strongest absolute correlation.
+    """
+    well_index = {w: i for i, w in enumerate(aligned["wells"])}
+    series_index = {s: j for j, s in enumerate(aligned["series"])}
+
+    rows, gw_cols, dr_cols = [], [], []
+    for well, station, distance in aligned["pairs"]:
+        for (s_station, param), j in series_index.items():
+            if s_station != station:
+                continue
+            rows.append((well, station, param, distance))
+            gw_cols.append(well_index[well])
+            dr_cols.append(j)
+
+    if not rows:
+        return pd.DataFrame(columns=[
+            "well_code", "well_name", "station", "param", "distance_km",
+            "r_lag0", "best_lag_days", "best_r", "samples"
+        ])
+
+    r, n = lagged_correlations(aligned["groundwater"][:, gw_cols], aligned["drought"][:, dr_cols], max_lag)
+    abs_r = np.where(np.isnan(r), -1.0, np.abs(r))
+    best = abs_r.argmax(axis=0)
+    cols = np.arange(len(rows))
+
+    result = pd.DataFrame(rows, columns=["well_code", "station", "param", "distance_km"])
+    result.insert(1, "well_name", [WELLS[w]["name"] for w in result["well_code"]])
+    result["r_lag0"] = r[0]
+    result["best_lag_days"] = np.where(np.isnan(r[best, cols]), -1, best)
+    result["best_r"] = r[best, cols]
+    result["samples"] = n[best, cols]
+    return result.round({"distance_km": 1, "r_lag0": 3, "best_r": 3})
+
+
+def run(
+    params: Optional[List[str]] = None,
+    days: int = 180,
+    max_lag: int = 60,
+    nearest: int = 2,
+    csv_path: str = GROUNDWATER_CSV,
+    use_cache: bool = True,
+) -> pd.DataFrame:
+    """Align both sources and compute the correlation table."""
+    params = params or DEFAULT_PARAMS
+    unknown = [p for p in params if p not in PARAM_IDS]
+    if unknown:
+        raise ValueError(f"Unknown parameter(s): {', '.join(unknown)}")
+    aligned = align_sources(params, days, nearest, csv_path, use_cache)
+    return correlate(aligned, max_lag)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Groundwater vs. drought lagged correlation")
+    parser.add_argument("--params", default=",".join(DEFAULT_PARAMS),
+                        help=f"Drought parameters, comma separated (from: {', '.join(PARAM_IDS)})")
+    parser.add_argument("--days", type=int, default=180, help="Analysis window in days")
+    parser.add_argument("--max-lag", type=int, default=60, help="Maximum lag in days")
+    parser.add_argument("--nearest", type=int, default=2, help="Drought stations paired with each well")
+    parser.add_argument("--csv", default=GROUNDWATER_CSV, help="Groundwater CSV backup (talajviz scraper)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore cached aligned matrices")
+    parser.add_argument("--format", choices=["markdown", "json"], default="markdown")
+    args = parser.parse_args()
+
+    result = run(
+        params=[p.strip() for p in args.params.split(",") if p.strip()],
+        days=args.days,
+        max_lag=args.max_lag,
+        nearest=args.nearest,
+        csv_path=args.csv,
+        use_cache=not args.no_cache,
+    )
+
+    if args.format == "json":
+        print(result.to_json(orient="records", force_ascii=False, indent=2))
+    else:
+        print(result.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
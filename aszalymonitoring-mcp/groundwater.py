@@ -0,0 +1,313 @@
+"""
+Groundwater Level Index for the MCP Server
+
+In-memory snapshot of the talajviz scraper output, keyed by well code and
+date, so the groundwater tools answer without a database query per call.
+
+Sources (GROUNDWATER_SOURCE = "supabase" | "csv" | "auto"):
+- supabase: groundwater_data via PostgREST (SUPABASE_URL + SUPABASE_ANON_KEY or
+  SUPABASE_SERVICE_ROLE_KEY). Incremental refresh: only rows with
+  created_at >= the last seen created_at minus a safety margin
+  (GROUNDWATER_WATERMARK_MARGIN_MINUTES, default: 10) are fetched.
+- csv: the scraper's local backup (talajviz/data/talajviz_adatok.csv). The
+  scraper only appends rows, so a refresh parses just the rows after the last
+  seen row count; a shrunk / replaced file triggers a full reload.
+
+"auto" uses Supabase when its credentials are set, otherwise the CSV.
+Refreshes happen at most every GROUNDWATER_REFRESH_SECONDS (default: 300).
+"""
+
+import bisect
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "_shared"))
+from dunapp_http import get_client
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GROUNDWATER_CSV = os.getenv(
+    "GROUNDWATER_CSV", os.path.join(BASE_DIR, "..", "talajviz", "data", "talajviz_adatok.csv")
+)
+GROUNDWATER_SOURCE = os.getenv("GROUNDWATER_SOURCE", "auto")
+REFRESH_SECONDS = int(os.getenv("GROUNDWATER_REFRESH_SECONDS", "300"))
+SUPABASE_PAGE_SIZE = 1000
+WATERMARK_MARGIN_MINUTES = int(os.getenv("GROUNDWATER_WATERMARK_MARGIN_MINUTES", "10"))
+# How far (days) a ranked well's readings may be from the requested window
+RANK_TOLERANCE_DAYS = int(os.getenv("GROUNDWATER_RANK_TOLERANCE_DAYS", "3"))
+TIMEOUT_SECONDS = 20
+
+# Groundwater wells (from supabase/migrations/002_seed_data.sql)
+WELLS = {
+    "4576": {"name": "Sátorhely", "lat": 46.3333, "lon": 19.3667},
+    "1460": {"name": "Mohács", "lat": 45.9928, "lon": 18.6836},
+    "1450": {"name": "Hercegszántó", "lat": 46.1833, "lon": 19.0167},
+    "662": {"name": "Alsónyék", "lat": 46.2667, "lon": 18.5667},
+    "656": {"name": "Szekszárd-Borrév", "lat": 46.3481, "lon": 18.7097},
+    "912": {"name": "Mohács II.", "lat": 45.9928, "lon": 18.6836},
+    "4481": {"name": "Mohács-Sárhát", "lat": 45.9928, "lon": 18.6836},
+    "4479": {"name": "Nagybaracska", "lat": 46.1333, "lon": 18.9833},
+    "1426": {"name": "Érsekcsanád", "lat": 46.2833, "lon": 19.4167},
+    "653": {"name": "Őcsény", "lat": 46.3167, "lon": 18.6667},
+    "1461": {"name": "Kölked", "lat": 46.0167, "lon": 18.7500},
+    "448": {"name": "Dávod", "lat": 46.4167, "lon": 18.7667},
+    "132042": {"name": "Szeremle", "lat": 46.5500, "lon": 19.0333},
+    "658": {"name": "Decs", "lat": 46.3833, "lon": 18.7167},
+    "660": {"name": "Báta", "lat": 46.2000, "lon": 18.7833},
+}
+
+
+class GroundwaterIndex:
+    """
+    Per-well daily levels: {well_code: {date: (timestamp, level_m)}} plus a
+    sorted date list per well for range queries (bisect).
+
+    When a well has several readings on one day, the latest timestamp wins.
+    """
+
+    def __init__(self, source: str = GROUNDWATER_SOURCE, csv_path: str = GROUNDWATER_CSV,
+                 refresh_seconds: int = REFRESH_SECONDS):
+        self.source = self._resolve_source(source)
+        self.csv_path = csv_path
+        self.refresh_seconds = refresh_seconds
+
+        self.levels: Dict[str, Dict[date, Tuple[str, float]]] = {}
+        self.dates: Dict[str, List[date]] = {}
+        self.names: Dict[str, str] = {code: info["name"] for code, info in WELLS.items()}
+
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+        self._csv_stat: Optional[Tuple[int, int, int]] = None  # (inode, size, mtime_ns)
+        self._csv_rows = 0
+        self._watermark: Optional[str] = None  # last seen groundwater_data.created_at
+
+    @staticmethod
+    def _resolve_source(source: str) -> str:
+        if source != "auto":
+            return source
+        has_key = os.getenv("SUPABASE_ANON_KEY") or os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+        return "supabase" if os.getenv("SUPABASE_URL") and has_key else "csv"
+
+    # -------------------------------------------------------------------------
+    # Loading
+    # -------------------------------------------------------------------------
+
+    def reset(self):
+        self.levels, self.dates = {}, {}
+        self._csv_stat, self._csv_rows, self._watermark = None, 0, None
+
+    def add(self, well_code: str, timestamp: str, level: float) -> bool:
+        """Insert / overwrite one reading. Returns True if the index changed."""
+        day = date.fromisoformat(timestamp[:10])
+        by_date = self.levels.setdefault(well_code, {})
+        current = by_date.get(day)
+        if current is not None and (current[0] > timestamp or current == (timestamp, level)):
+            return False
+        if current is None:
+            bisect.insort(self.dates.setdefault(well_code, []), day)
+        by_date[day] = (timestamp, level)
+        return True
+
+    def ensure_fresh(self, force: bool = False) -> int:
+        """Refresh from the source if the snapshot is older than refresh_seconds. Returns rows ingested."""
+        with self._lock:
+            if not force and self._last_refresh and time.monotonic() - self._last_refresh < self.refresh_seconds:
+                return 0
+            added = self._refresh_supabase() if self.source == "supabase" else self._refresh_csv()
+            self._last_refresh = time.monotonic()
+            return added
+
+    def _refresh_csv(self) -> int:
+        try:
+            st = os.stat(self.csv_path)
+        except FileNotFoundError:
+            self.reset()
+            return 0
+
+        stat = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if stat == self._csv_stat:
+            return 0
+        if self._csv_stat and (st.st_ino != self._csv_stat[0] or st.st_size < self._csv_stat[1]):
+            self.reset()  # replaced or truncated: rows may have changed, not only appended
+
+        # The scraper rewrites the backup as existing rows + new rows, so skip what we already have
+        df = pd.read_csv(
+            self.csv_path, dtype={"torzsszam": str},
+            skiprows=range(1, self._csv_rows + 1) if self._csv_rows else None,
+        )
+        time_col = "timestamp" if "timestamp" in df.columns else "datum"
+        levels = pd.to_numeric(df["vizszint"], errors="coerce")
+
+        added = 0
+        for code, ts, level, name in zip(df["torzsszam"], df[time_col].astype(str), levels, df.get("kut_nev", df["torzsszam"])):
+            if pd.isna(level) or not code:
+                continue
+            self.names.setdefault(code, str(name))
+            added += self.add(code, ts.replace(" ", "T", 1), float(level))
+
+        self._csv_rows += len(df)
+        self._csv_stat = stat
+        return added
+
+    def _refresh_supabase(self) -> int:
+        url = f"{os.environ['SUPABASE_URL'].rstrip('/')}/rest/v1/groundwater_data"
+        key = os.getenv("SUPABASE_ANON_KEY") or os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+        headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+
+        # Rows of one insert batch share created_at, so page with offset over ">= watermark";
+        # re-reading the rows at the watermark is harmless (add() is idempotent)
+        params = {
+            # well_id has two FKs to groundwater_wells (001_initial_schema.sql), so name one
+            "select": "timestamp,water_level_meters,created_at,groundwater_wells!fk_groundwater_well(well_code,well_name)",
+            "order": "created_at.asc,id.asc",
+            "limit": str(SUPABASE_PAGE_SIZE),
+        }
+        if self._watermark:
+            # Concurrent scraper workers can commit out of created_at order (a row with an
+            # earlier created_at becomes visible after a later one), so re-read a margin
+            since = datetime.fromisoformat(self._watermark) - timedelta(minutes=WATERMARK_MARGIN_MINUTES)
+            params["created_at"] = f"gte.{since.isoformat()}"
+
+        added, offset, watermark = 0, 0, self._watermark
+        while True:
+            response = get_client().get(url, params={**params, "offset": str(offset)},
+                                        headers=headers, timeout=TIMEOUT_SECONDS, cache=False)
+            response.raise_for_status()
+            rows = response.json()
+            for row in rows:
+                well = row.get("groundwater_wells") or {}
+                code = well.get("well_code")
+                if code is None or row.get("water_level_meters") is None:
+                    continue
+                if well.get("well_name"):
+                    self.names.setdefault(code, well["well_name"])
+                added += self.add(code, row["timestamp"], float(row["water_level_meters"]))
+                watermark = max(watermark or "", row["created_at"])
+            if len(rows) < SUPABASE_PAGE_SIZE:
+                break
+            offset += SUPABASE_PAGE_SIZE
+
+        self._watermark = watermark
+        return added
+
+    # -------------------------------------------------------------------------
+    # Queries
+    # -------------------------------------------------------------------------
+
+    def resolve_well(self, well: str) -> Optional[str]:
+        """Well code from a code or (case-insensitive) name."""
+        if well in self.levels or well in WELLS:
+            return well
+        wanted = well.strip().casefold()
+        for code, name in self.names.items():
+            if name.casefold() == wanted:
+                return code
+        return None
+
+    def level_on_or_before(self, code: str, day: date) -> Optional[Tuple[date, float]]:
+        dates = self.dates.get(code, [])
+        i = bisect.bisect_right(dates, day)
+        if i == 0:
+            return None
+        found = dates[i - 1]
+        return found, self.levels[code][found][1]
+
+    def latest(self, codes: Optional[List[str]] = None) -> List[Dict]:
+        """Latest reading per well, with the change since the previous reading."""
+        result = []
+        for code in codes or sorted(self.dates, key=lambda c: self.names.get(c, c)):
+            dates = self.dates.get(code)
+            if not dates:
+                continue
+            timestamp, level = self.levels[code][dates[-1]]
+            previous = self.levels[code][dates[-2]][1] if len(dates) > 1 else None
+            result.append({
+                "well_code": code,
+                "well_name": self.names.get(code, code),
+                "date": dates[-1].isoformat(),
+                "timestamp": timestamp,
+                "water_level_meters": level,
+                "change_meters": round(level - previous, 3) if previous is not None else None,
+            })
+        return result
+
+    def history(self, code: str, from_date: date, to_date: date) -> List[Dict]:
+        """Daily readings of one well in [from_date, to_date]."""
+        dates = self.dates.get(code, [])
+        lo = bisect.bisect_left(dates, from_date)
+        hi = bisect.bisect_right(dates, to_date)
+        return [
+            {"date": d.isoformat(), "timestamp": self.levels[code][d][0], "water_level_meters": self.levels[code][d][1]}
+            for d in dates[lo:hi]
+        ]
+
+    def ranked_by_change(self, days: int, order: str = "abs", limit: Optional[int] = None) -> List[Dict]:
+        """
+        Wells ranked by level change over the last `days` days (each well's latest
+        reading vs. its reading on / before latest - days).
+
+        Wells are skipped when their latest reading is more than RANK_TOLERANCE_DAYS
+        older than the newest reading in the index, or when they have no reading
+        within RANK_TOLERANCE_DAYS before the start of the window, so every change
+        covers (roughly) the same period.
+
+        order: "rise" (largest increase first), "fall" (largest decrease first), "abs"
+        """
+        if days <= 0:
+            raise ValueError("days must be a positive integer")
+        if limit is not None and limit <= 0:
+            raise ValueError("limit must be a positive integer")
+
+        newest = max((dates[-1] for dates in self.dates.values() if dates), default=None)
+        if newest is None:
+            return []
+        tolerance = timedelta(days=RANK_TOLERANCE_DAYS)
+
+        ranked = []
+        for code, dates in self.dates.items():
+            if not dates or dates[-1] < newest - tolerance:
+                continue
+            end_day = dates[-1]
+            window_start = end_day - timedelta(days=days)
+            start = self.level_on_or_before(code, window_start)
+            if start is None or start[0] < window_start - tolerance:
+                continue
+            end_level = self.levels[code][end_day][1]
+            ranked.append({
+                "well_code": code,
+                "well_name": self.names.get(code, code),
+                "from_date": start[0].isoformat(),
+                "to_date": end_day.isoformat(),
+                "from_level_meters": start[1],
+                "to_level_meters": end_level,
+                "change_meters": round(end_level - start[1], 3),
+            })
+
+        if order == "rise":
+            ranked.sort(key=lambda r: -r["change_meters"])
+        elif order == "fall":
+            ranked.sort(key=lambda r: r["change_meters"])
+        else:
+            ranked.sort(key=lambda r: -abs(r["change_meters"]))
+        return ranked if limit is None else ranked[:limit]
+
+
+_index: Optional[GroundwaterIndex] = None
+
+
+def get_index() -> GroundwaterIndex:
+    """Process-wide index, refreshed incrementally on access."""
+    global _index
+    if _index is None:
+        _index = GroundwaterIndex()
+    _index.ensure_fresh()
+    return _index
+
+
+def parse_date(value: Optional[str], default: date) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date() if value else default
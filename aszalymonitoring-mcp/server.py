@@ -3,10 +3,13 @@
 Aszálymonitoring MCP Server
 
 Provides tools to access drought monitoring data from aszalymonitoring.vizugy.hu
-for 5 locations in southern Hungary: Katymár, Dávod, Szederkény, Sükösd, Csávoly.
+for 5 locations in southern Hungary: Katymár, Dávod, Szederkény, Sükösd, Csávoly,
+and groundwater well levels from the talajviz scraper (see groundwater.py).
 """
 
-import requests
+import asyncio
+import os
+import sys
 from mcp.server.models import InitializationOptions
 from mcp.server import Server
 from pydantic import BaseModel
@@ -15,6 +18,11 @@ import json
 import html
 from datetime import datetime, timedelta
 
+# Shared pooled HTTP client (connection reuse, per-host rate limit, retry/backoff, optional disk cache)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "_shared"))
+from dunapp_http import get_client
+from groundwater import get_index, parse_date
+
 # Initialize the server
 server = Server("aszalymonitoring-mcp-server")
 
@@ -53,8 +61,7 @@ LOCATIONS = {
 }
 
 API_URL = "https://aszalymonitoring.vizugy.hu/api.php"
-TIMEOUT_SECONDS = 20  # Longer timeout for slow server
-MAX_RETRIES = 2  # Retry failed requests
+TIMEOUT_SECONDS = 20  # Longer timeout for slow server (retries: see _shared/dunapp_http.py)
 
 # Parameter IDs (varid) from getvariables API
 PARAM_IDS = {
@@ -112,40 +119,30 @@ def fetch_measurements_from_api(statid: str, varid: int, days_back: int = 7) ->
         fromdate = (today - timedelta(days=days_back)).strftime('%Y-%m-%d')
         todate = today.strftime('%Y-%m-%d')
 
-        for attempt in range(MAX_RETRIES):
-            try:
-                response = requests.post(
-                    API_URL,
-                    data={
-                        'view': 'getmeas',
-                        'statid': statid,
-                        'varid': str(varid),
-                        'fromdate': fromdate,
-                        'todate': todate
-                    },
-                    headers={'User-Agent': 'Mozilla/5.0'},
-                    timeout=TIMEOUT_SECONDS
-                )
-
-                if response.status_code == 200:
-                    # Parse HTML-encoded JSON
-                    decoded = html.unescape(response.text)
-                    data = json.loads(decoded)
-
-                    # API returns: {"entries": [[{...}, {...}]]}
-                    entries = data.get('entries', [])
-                    if entries and len(entries) > 0 and isinstance(entries[0], list):
-                        return entries[0]  # Return the measurements list
+        response = get_client().post(
+            API_URL,
+            data={
+                'view': 'getmeas',
+                'statid': statid,
+                'varid': str(varid),
+                'fromdate': fromdate,
+                'todate': todate
+            },
+            headers={'User-Agent': 'Mozilla/5.0'},
+            timeout=TIMEOUT_SECONDS
+        )
 
-                return None  # No data or unexpected format
+        if response.status_code == 200:
+            # Parse HTML-encoded JSON
+            decoded = html.unescape(response.text)
+            data = json.loads(decoded)
 
-            except (requests.Timeout, requests.ConnectionError) as e:
-                if attempt < MAX_RETRIES - 1:
-                    continue  # Retry
-                else:
-                    return None  # Give up after retries
+            # API returns: {"entries": [[{...}, {...}]]}
+            entries = data.get('entries', [])
+            if entries and len(entries) > 0 and isinstance(entries[0], list):
+                return entries[0]  # Return the measurements list
 
-        return None
+        return None  # No data or unexpected format
 
     except Exception as e:
         return None  # API call failed
@@ -281,6 +278,53 @@ def format_all_drought_data_markdown(data_list: List[DroughtData]) -> str:
 *Frissítve*: {datetime.now().isoformat()}"""
 
 
+def format_groundwater_latest_markdown(rows: List[Dict]) -> str:
+    """Format latest groundwater levels as markdown table."""
+    lines = []
+    for r in rows:
+        change = "-" if r["change_meters"] is None else f"{r['change_meters']:+.2f} m"
+        lines.append(
+            f"| {r['well_name']} | {r['well_code']} | {r['water_level_meters']:.2f} m | {change} | {r['date']} |"
+        )
+    table = "| Kút | Kód | Vízszint | Változás | Dátum |\n" \
+            "|-----|-----|----------|----------|-------|\n" + "\n".join(lines)
+
+    return f"""# Talajvízszintek - Legfrissebb
+
+{table}
+
+*Változás*: az előző napi méréshez képest"""
+
+
+def format_groundwater_history_markdown(well_name: str, well_code: str, rows: List[Dict]) -> str:
+    """Format one well's level history as markdown table."""
+    lines = [f"| {r['date']} | {r['water_level_meters']:.2f} m |" for r in rows]
+    table = "| Dátum | Vízszint |\n|-------|----------|\n" + "\n".join(lines)
+
+    return f"""# Talajvízszint Idősor - {well_name} (#{well_code})
+
+{table}
+
+*Mérések száma*: {len(rows)}"""
+
+
+def format_groundwater_ranking_markdown(rows: List[Dict], days: int) -> str:
+    """Format wells ranked by level change as markdown table."""
+    lines = [
+        f"| {i} | {r['well_name']} | {r['from_level_meters']:.2f} m | {r['to_level_meters']:.2f} m | "
+        f"{r['change_meters']:+.2f} m |"
+        for i, r in enumerate(rows, start=1)
+    ]
+    table = "| # | Kút | Kezdő | Utolsó | Változás |\n" \
+            "|---|-----|-------|--------|----------|\n" + "\n".join(lines)
+
+    return f"""# Talajvízszint Változás - {days} nap
+
+{table}
+
+*Vízszint*: terepszint alatti mélység (m)"""
+
+
 # MCP Tools
 @server.list_tools()
 async def list_tools():
@@ -322,6 +366,85 @@ async def list_tools():
                 }
             }
         },
+        {
+            "name": "get_groundwater_latest",
+            "description": "Get the latest groundwater level of each well (talajviz scraper data), with the change since the previous reading",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "wells": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Well codes or names (default: all wells)"
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": ["json", "markdown"],
+                        "default": "json",
+                        "description": "Response format"
+                    }
+                }
+            }
+        },
+        {
+            "name": "get_groundwater_history",
+            "description": "Get the daily groundwater level history of one well for a date range",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "well": {
+                        "type": "string",
+                        "description": "Well code (e.g. 4576) or name (e.g. Sátorhely)"
+                    },
+                    "from_date": {
+                        "type": "string",
+                        "description": "Start date YYYY-MM-DD (default: 30 days before to_date)"
+                    },
+                    "to_date": {
+                        "type": "string",
+                        "description": "End date YYYY-MM-DD (default: today)"
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": ["json", "markdown"],
+                        "default": "json",
+                        "description": "Response format"
+                    }
+                },
+                "required": ["well"]
+            }
+        },
+        {
+            "name": "rank_groundwater_change",
+            "description": "Rank wells by groundwater level change over the last N days",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "days": {
+                        "type": "integer",
+                        "default": 7,
+                        "description": "Period length in days"
+                    },
+                    "order": {
+                        "type": "string",
+                        "enum": ["abs", "rise", "fall"],
+                        "default": "abs",
+                        "description": "Largest absolute change, largest rise or largest fall first"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "description": "Maximum number of wells (default: all)"
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": ["json", "markdown"],
+                        "default": "json",
+                        "description": "Response format"
+                    }
+                }
+            }
+        },
         {
             "name": "list_locations",
             "description": "List all available drought monitoring locations with coordinates",
@@ -341,7 +464,8 @@ async def call_tool(name: str, arguments: dict):
             location = arguments.get("location", "Katymár")
             fmt = arguments.get("format", "json")
 
-            data = fetch_drought_data_for_location(location)
+            # Blocking fetch runs in a worker thread so the event loop stays responsive
+            data = await asyncio.to_thread(fetch_drought_data_for_location, location)
 
             if fmt == "markdown":
                 return format_drought_data_markdown(data)
@@ -351,15 +475,57 @@ async def call_tool(name: str, arguments: dict):
         elif name == "get_all_drought_data":
             fmt = arguments.get("format", "json")
 
-            data_list = [
-                fetch_drought_data_for_location(loc) for loc in LOCATIONS.keys()
-            ]
+            # Locations are fetched concurrently; the shared client's rate limit caps the load
+            data_list = await asyncio.gather(*[
+                asyncio.to_thread(fetch_drought_data_for_location, loc) for loc in LOCATIONS.keys()
+            ])
 
             if fmt == "markdown":
                 return format_all_drought_data_markdown(data_list)
             else:
                 return json.dumps([d.model_dump() for d in data_list], indent=2)
 
+        elif name in ("get_groundwater_latest", "get_groundwater_history", "rank_groundwater_change"):
+            fmt = arguments.get("format", "json")
+            # Incremental refresh (at most every GROUNDWATER_REFRESH_SECONDS), off the event loop
+            index = await asyncio.to_thread(get_index)
+
+            if name == "get_groundwater_latest":
+                codes = None
+                if arguments.get("wells"):
+                    codes = [index.resolve_well(w) for w in arguments["wells"]]
+                    unknown = [w for w, c in zip(arguments["wells"], codes) if c is None]
+                    if unknown:
+                        return f"Unknown well: {', '.join(unknown)}"
+                rows = index.latest(codes)
+
+                if fmt == "markdown":
+                    return format_groundwater_latest_markdown(rows)
+                return json.dumps(rows, indent=2, ensure_ascii=False)
+
+            if name == "get_groundwater_history":
+                code = index.resolve_well(arguments.get("well", ""))
+                if code is None:
+                    return f"Unknown well: {arguments.get('well')}"
+                to_date = parse_date(arguments.get("to_date"), datetime.now().date())
+                from_date = parse_date(arguments.get("from_date"), to_date - timedelta(days=30))
+                rows = index.history(code, from_date, to_date)
+
+                if fmt == "markdown":
+                    return format_groundwater_history_markdown(index.names.get(code, code), code, rows)
+                return json.dumps(
+                    {"well_code": code, "well_name": index.names.get(code, code), "measurements": rows},
+                    indent=2, ensure_ascii=False
+                )
+
+            days = int(arguments.get("days", 7))
+            limit = int(arguments["limit"]) if arguments.get("limit") is not None else None
+            rows = index.ranked_by_change(days, arguments.get("order", "abs"), limit)
+
+            if fmt == "markdown":
+                return format_groundwater_ranking_markdown(rows, days)
+            return json.dumps(rows, indent=2, ensure_ascii=False)
+
         elif name == "list_locations":
             locations_info = []
             for name, info in LOCATIONS.items():
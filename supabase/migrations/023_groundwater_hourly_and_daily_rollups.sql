@@ -0,0 +1,73 @@
+-- ============================================================================
+-- MIGRATION 023: Groundwater Full-Resolution Data + Daily Rollups
+-- ============================================================================
+-- Purpose: Store the full hourly series scraped from vizugy.hu separately from
+-- the morning (07:00 / 08:00) readings in groundwater_data, plus a small daily
+-- rollup table (min / max / mean / last) for dashboards.
+--
+-- Populated by: talajviz/talajviz_scraper_supabase.py --full-resolution
+-- Created: 2026-10-19
+-- ============================================================================
+
+-- Raw hourly measurements (detail for analysis)
+CREATE TABLE IF NOT EXISTS groundwater_data_hourly (
+  id BIGSERIAL PRIMARY KEY,
+  well_id UUID NOT NULL REFERENCES groundwater_wells(id) ON DELETE CASCADE,
+  water_level_meters DECIMAL(6,2) NOT NULL,
+  timestamp TIMESTAMPTZ NOT NULL,
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  CONSTRAINT unique_well_hourly_timestamp UNIQUE (well_id, timestamp)
+);
+
+CREATE INDEX IF NOT EXISTS idx_groundwater_data_hourly_well_timestamp
+  ON groundwater_data_hourly(well_id, timestamp DESC);
+
+-- Daily rollups (one row per well per day, upserted as the day fills up)
+CREATE TABLE IF NOT EXISTS groundwater_daily_rollups (
+  id BIGSERIAL PRIMARY KEY,
+  well_id UUID NOT NULL REFERENCES groundwater_wells(id) ON DELETE CASCADE,
+  date DATE NOT NULL,
+  min_level_meters DECIMAL(6,2) NOT NULL,
+  max_level_meters DECIMAL(6,2) NOT NULL,
+  mean_level_meters DECIMAL(6,2) NOT NULL,
+  last_level_meters DECIMAL(6,2) NOT NULL,
+  last_timestamp TIMESTAMPTZ NOT NULL,
+  sample_count INTEGER NOT NULL,
+  updated_at TIMESTAMPTZ DEFAULT NOW(),
+  CONSTRAINT unique_well_rollup_date UNIQUE (well_id, date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_groundwater_daily_rollups_well_date
+  ON groundwater_daily_rollups(well_id, date DESC);
+
+-- Enable Row Level Security
+ALTER TABLE groundwater_data_hourly ENABLE ROW LEVEL SECURITY;
+ALTER TABLE groundwater_daily_rollups ENABLE ROW LEVEL SECURITY;
+
+-- Public read access
+CREATE POLICY "groundwater_data_hourly_public_read"
+ON groundwater_data_hourly
+FOR SELECT
+USING (true);
+
+CREATE POLICY "groundwater_daily_rollups_public_read"
+ON groundwater_daily_rollups
+FOR SELECT
+USING (true);
+
+-- Service role can write
+CREATE POLICY "groundwater_data_hourly_service_write"
+ON groundwater_data_hourly
+FOR ALL
+USING (auth.role() = 'service_role');
+
+CREATE POLICY "groundwater_daily_rollups_service_write"
+ON groundwater_daily_rollups
+FOR ALL
+USING (auth.role() = 'service_role');
+
+-- Add comments
+COMMENT ON TABLE groundwater_data_hourly IS 'Full-resolution (hourly) groundwater level measurements from vizugy.hu';
+COMMENT ON TABLE groundwater_daily_rollups IS 'Daily min/max/mean/last groundwater level per well, computed by the scraper';
+COMMENT ON COLUMN groundwater_daily_rollups.last_level_meters IS 'Latest reading of the day (at last_timestamp)';
+COMMENT ON COLUMN groundwater_daily_rollups.sample_count IS 'Number of hourly readings the rollup was computed from';
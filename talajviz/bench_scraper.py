@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Talajvízkút Scraper Benchmark - helyi vizugy.hu és PostgREST helyettesítőkkel
+
+A talajviz_scraper_supabase.py lépéseit méri éles szolgáltatások nélkül:
+  1. scrape_well_data           - helyi HTTP szerver szintetikus chartView() oldalakkal
+  2. insert_measurements_to_supabase - helyi hamis Supabase / PostgREST végpont
+  3. save_to_csv_backup         - különböző méretűre előtöltött CSV backup
+
+Lépésenként átviteli sebességet (rekord/s) és memória csúcsot (tracemalloc) jelent.
+
+Használat:
+  python bench_scraper.py
+  python bench_scraper.py --points 2000,8760,26280 --wells 5 --latency-ms 0,50
+  python bench_scraper.py --csv-rows 0,10000,100000 --json eredmeny.json
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Callable, Tuple
+from urllib.parse import urlparse, parse_qs
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# =============================================================================
+# SZINTETIKUS ADATOK
+# =============================================================================
+
+def make_chart_page(points: int, seed: int = 0, end: datetime = None) -> str:
+    """
+    Szintetikus vizugy.hu kút oldal: chartView([vízszintek cm],[timestamp-ek],...)
+
+    `points` darab órás mérés, `end`-ig visszafelé (több éves idősor is lehet).
+    """
+    rng = random.Random(seed)
+    end = (end or datetime.now()).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(hours=points - 1)
+
+    level = 600
+    levels, timestamps = [], []
+    for i in range(points):
+        level = max(100, min(900, level + rng.choice((-1, 0, 0, 1))))
+        levels.append(str(level))
+        timestamps.append((start + timedelta(hours=i)).strftime("%Y-%m-%d %H:%M:%S") + ".0000000")
+
+    return (
+        "<html><head><title>Talajvízkút grafikon</title></head><body>\n"
+        "<div id=\"chart\"></div>\n<script>\n"
+        f"chartView({json.dumps(levels)},{json.dumps(timestamps)},\"cm\",\"Talajvízszint\");\n"
+        "</script></body></html>"
+    )
+
+
+def seed_csv_backup(path: str, rows: int, wells: List[Dict[str, str]]):
+    """CSV backup előtöltése `rows` sorra (a scraper által írt oszlopokkal)"""
+    end = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0) - timedelta(days=3650)
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "vizszint", "kut_nev", "torzsszam"])
+        for i in range(rows):
+            kut = wells[i % len(wells)]
+            day = end - timedelta(days=i // len(wells))
+            writer.writerow([day.strftime("%Y-%m-%d %H:%M:%S") + ".0000000", "6.16", kut["nev"], kut["torzsszam"]])
+
+# =============================================================================
+# HELYI SZERVEREK
+# =============================================================================
+
+class VizugyStandIn(BaseHTTPRequestHandler):
+    """talajvizkut_grafikon/index.php helyettesítő, beállítható késleltetéssel"""
+    pages: Dict[str, bytes] = {}
+    latency_s = 0.0
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        torzsszam = parse_qs(parsed.query).get("torzsszam", [""])[0]
+        if parsed.path != "/talajvizkut_grafikon/index.php" or torzsszam not in self.pages:
+            self.send_error(404)
+            return
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        body = self.pages[torzsszam]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PostgrestStandIn(BaseHTTPRequestHandler):
+    """
+    Minimális Supabase / PostgREST helyettesítő
+
+    GET  /rest/v1/groundwater_wells?select=id&well_code=eq.X  → kút ID
+    POST /rest/v1/<tábla>?on_conflict=...                      → upsert, memóriában
+    """
+    protocol_version = "HTTP/1.1"
+    stored: Dict[str, set] = {}
+    lock = threading.Lock()
+    latency_s = 0.0
+
+    def _reply(self, status: int, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        if parsed.path == "/rest/v1/groundwater_wells":
+            well_code = query.get("well_code", ["eq."])[0][3:]
+            row = {"id": f"00000000-0000-0000-0000-{int(well_code):012d}"}
+            single = "vnd.pgrst.object" in self.headers.get("Accept", "")
+            self._reply(200, row if single else [row])
+            return
+        self._reply(200, [])
+
+    def do_POST(self):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        table = urlparse(self.path).path.rsplit("/", 1)[-1]
+        rows = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"[]")
+        if isinstance(rows, dict):
+            rows = [rows]
+        inserted = []
+        with self.lock:
+            keys = self.stored.setdefault(table, set())
+            for row in rows:
+                key = (row.get("well_id"), row.get("timestamp") or row.get("date"))
+                if key not in keys:
+                    keys.add(key)
+                    inserted.append(row)
+        self._reply(201, inserted)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(handler) -> Tuple[ThreadingHTTPServer, str]:
+    """Szerver indítása szabad porton, háttérszálon"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+# =============================================================================
+# MÉRÉS
+# =============================================================================
+
+def measure(fn: Callable, reset: Callable = None) -> Tuple[float, int, object]:
+    """
+    Futási idő (külön, tracemalloc nélküli futásból) és memória csúcs
+
+    Returns:
+        (másodperc, csúcs bájt, a mért futás eredménye)
+    """
+    if reset:
+        reset()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+
+    if reset:
+        reset()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def report_row(stage: str, params: str, records: int, elapsed: float, peak: int) -> Dict:
+    rate = records / elapsed if elapsed > 0 else float("inf")
+    print(f"{stage:<34} {params:<28} {records:>9} {elapsed:>9.3f} {rate:>12.0f} {peak / 1e6:>10.1f}")
+    return {"stage": stage, "params": params, "records": records,
+            "seconds": round(elapsed, 4), "records_per_s": round(rate, 1), "peak_mb": round(peak / 1e6, 2)}
+
+# =============================================================================
+# FŐPROGRAM
+# =============================================================================
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Talajvízkút scraper benchmark (helyi helyettesítőkkel)")
+    parser.add_argument("--points", type=parse_int_list, default=[2000, 8760, 26280],
+                        help="Órás mérések száma oldalanként, vesszővel (26280 = 3 év)")
+    parser.add_argument("--wells", type=int, default=5, help="Kutak száma futásonként")
+    parser.add_argument("--latency-ms", type=parse_int_list, default=[0],
+                        help="vizugy.hu helyettesítő válaszkésleltetése (ms), vesszővel")
+    parser.add_argument("--db-latency-ms", type=int, default=0,
+                        help="PostgREST helyettesítő késleltetése kötegenként (ms)")
+    parser.add_argument("--csv-rows", type=parse_int_list, default=[0, 10000, 100000],
+                        help="CSV backup előtöltési méretei, vesszővel")
+    parser.add_argument("--json", help="Eredmények mentése JSON fájlba")
+    args = parser.parse_args(argv)
+
+    # A scraper import előtt: hamis kulcsok, munkakönyvtár (data/, journal, log) ideiglenes mappában
+    os.environ["SUPABASE_URL"] = "http://127.0.0.1:1"
+    os.environ["SUPABASE_SERVICE_ROLE_KEY"] = "bench.bench.bench"
+    json_out = os.path.abspath(args.json) if args.json else None
+    workdir = tempfile.mkdtemp(prefix="talajviz_bench_")
+    os.chdir(workdir)
+    sys.path.insert(0, SCRIPT_DIR)
+    import talajviz_scraper_supabase as scraper
+    scraper.logger.setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    vizugy, vizugy_url = start_server(VizugyStandIn)
+    postgrest, postgrest_url = start_server(PostgrestStandIn)
+    scraper.VIZUGY_BASE_URL = vizugy_url
+    PostgrestStandIn.latency_s = args.db_latency_ms / 1000.0
+
+    from supabase import create_client
+    supabase = create_client(postgrest_url, "bench.bench.bench")
+
+    wells = [{"nev": f"Bench kút {i}", "torzsszam": str(9000 + i)} for i in range(args.wells)]
+    results = []
+
+    print(f"Munkakönyvtár: {workdir}")
+    print(f"{'Lépés':<34} {'Paraméterek':<28} {'Rekord':>9} {'Idő (s)':>9} {'Rekord/s':>12} {'Csúcs MB':>10}")
+    print("-" * 107)
+
+    for points in args.points:
+        VizugyStandIn.pages = {
+            w["torzsszam"]: make_chart_page(points, seed=i).encode() for i, w in enumerate(wells)
+        }
+
+        # 1. scrape_well_data (letöltés + chartView feldolgozás)
+        measurements_by_well = {}
+        for latency in args.latency_ms:
+            VizugyStandIn.latency_s = latency / 1000.0
+
+            def scrape_all():
+                return {w["torzsszam"]: scraper.scrape_well_data(w["torzsszam"], w["nev"]) for w in wells}
+
+            elapsed, peak, measurements_by_well = measure(scrape_all)
+            results.append(report_row("scrape_well_data", f"{points} pont, {latency} ms",
+                                      points * len(wells), elapsed, peak))
+
+        # 2. insert_measurements_to_supabase (journal + kötegelt upsert)
+        def reset_db():
+            PostgrestStandIn.stored = {}
+
+        def insert_all():
+            total = 0
+            for w in wells:
+                well_id = scraper.get_well_id(supabase, w["torzsszam"])
+                total += scraper.insert_measurements_to_supabase(
+                    supabase, well_id, measurements_by_well[w["torzsszam"]], w["nev"], w["torzsszam"]
+                ) or 0
+            return total
+
+        rows = sum(len(m) for m in measurements_by_well.values())
+        elapsed, peak, _ = measure(insert_all, reset=reset_db)
+        results.append(report_row("insert_measurements_to_supabase", f"{points} pont",
+                                  rows, elapsed, peak))
+
+        # 3. save_to_csv_backup (különböző méretű meglévő backup mellé)
+        for csv_rows in args.csv_rows:
+            scraper.CSV_BACKUP_PATH = os.path.join(workdir, f"backup_{csv_rows}.csv")
+
+            def seed():
+                seed_csv_backup(scraper.CSV_BACKUP_PATH, csv_rows, wells)
+
+            elapsed, peak, _ = measure(lambda: scraper.save_to_csv_backup(measurements_by_well, wells), reset=seed)
+            results.append(report_row("save_to_csv_backup", f"{points} pont, {csv_rows} sor",
+                                      rows, elapsed, peak))
+
+    vizugy.shutdown()
+    postgrest.shutdown()
+
+    if json_out:
+        with open(json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Eredmények: {json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,16 @@ Naponta (06:00-kor) lefut, és:
   2. Közvetlenül beszúrja az új adatokat Supabase-be
   3. Opcionálisan CSV backup-ot is készít
   4. Csak új méréseket ad hozzá (duplikátum ellenőrzés)
+  5. Változatlan kút oldalakat nem tölt le / nem dolgoz fel újra
+     (ETag / Last-Modified feltételes kérés + tartalom hash)
+  6. Opcionálisan (--full-resolution) a teljes órás idősort és napi
+     min / max / átlag / utolsó összesítőket is menti, külön táblákba
+  7. Supabase kiesés esetén a feldolgozott kötegeket helyi write-ahead
+     journal-ban tartja, és később (--replay-journal) visszajátssza
+  8. Backfill mód (--backfill): a tárolt napokból intervallum-indexet épít,
+     és csak a hiányzó reggeli méréseket tölti le / szúrja be
+  9. Nagy kútlistánál több folyamatra osztja a munkát (shardok), és
+     checkpoint-ot vezet: megszakadt futás onnan folytatódik, ahol abbamaradt
 
 Követelmények:
   pip install requests beautifulsoup4 pandas supabase python-dotenv
@@ -14,15 +24,35 @@ Követelmények:
 Használat:
   python talajviz_scraper_supabase.py
   vagy: ./talajviz_scraper_supabase.py
+
+  Nagy kútkatalógus, 8 párhuzamos folyamattal:
+  python talajviz_scraper_supabase.py --kutak kutak_osszes.json --workers 8
+
+  Teljes órás felbontás + napi összesítők:
+  python talajviz_scraper_supabase.py --full-resolution
+
+  Journal-ban maradt kötegek beírása (Supabase kiesés után):
+  python talajviz_scraper_supabase.py --replay-journal
+
+  Hézagok pótlása (utolsó 365 nap, 4 párhuzamos folyamattal):
+  python talajviz_scraper_supabase.py --backfill --workers 4
+
+  Checkpoint figyelmen kívül hagyása (teljes újrafuttatás):
+  python talajviz_scraper_supabase.py --fresh
 """
 
 import os
 import sys
+import csv
 import json
 import re
+import hashlib
 import logging
-from datetime import datetime
-from typing import List, Dict, Optional
+import argparse
+import multiprocessing
+from contextlib import nullcontext
+from datetime import datetime, date, timedelta
+from typing import List, Dict, Optional, Tuple, Set, Iterable
 
 import requests
 from bs4 import BeautifulSoup
@@ -30,6 +60,10 @@ import pandas as pd
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+# Közös HTTP kliens (kapcsolat-újrahasznosítás, hosztonkénti rate limit, retry/backoff)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "_shared"))
+from dunapp_http import get_client
+
 # =============================================================================
 # KONFIGURÁCIÓ
 # =============================================================================
@@ -39,10 +73,22 @@ load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+VIZUGY_BASE_URL = os.getenv("VIZUGY_BASE_URL", "https://www.vizugy.hu")
 
 KUTAK_JSON = "kutak.json"
 CSV_BACKUP_PATH = "data/talajviz_adatok.csv"
 LOG_PATH = "data/scraper.log"
+CHECKPOINT_PATH = "data/checkpoint.jsonl"
+HTTP_CACHE_DIR = "data/http_cache"
+JOURNAL_DIR = "data/journal"
+JOURNAL_REJECTED_DIR = "data/journal/rejected"
+HOURLY_ARCHIVE_PATH = "data/talajviz_orankenti.csv"
+ROLLUP_ARCHIVE_PATH = "data/talajviz_napi_osszesito.csv"
+MORNING_HOURS = (7, 8)
+DONE_STATUSES = ("committed", "journaled")  # journaled: scrapolva, Supabase nyugtázásra vár
+SUPABASE_BATCH_SIZE = 1000
+DEFAULT_WORKERS = 1
+BACKFILL_DAYS = 365  # vizugy.hu oldal kb. ennyi napnyi adatot mutat
 
 # Logging beállítása
 os.makedirs("data", exist_ok=True)
@@ -81,15 +127,15 @@ def init_supabase() -> Optional[Client]:
 # KÚTLISTA BETÖLTÉS
 # =============================================================================
 
-def load_wells() -> List[Dict[str, str]]:
-    """Kútlista betöltése kutak.json-ból"""
+def load_wells(path: str = KUTAK_JSON) -> List[Dict[str, str]]:
+    """Kútlista betöltése kutak.json-ból (vagy a megadott katalógusból)"""
     try:
-        with open(KUTAK_JSON, "r", encoding="utf-8") as f:
+        with open(path, "r", encoding="utf-8") as f:
             kutak = json.load(f)
-        logger.info(f"✅ {len(kutak)} kút betöltve a kutak.json-ból")
+        logger.info(f"✅ {len(kutak)} kút betöltve: {path}")
         return kutak
     except FileNotFoundError:
-        logger.error(f"❌ Nem található: {KUTAK_JSON}")
+        logger.error(f"❌ Nem található: {path}")
         sys.exit(1)
     except json.JSONDecodeError as e:
         logger.error(f"❌ Hibás JSON formátum: {e}")
@@ -99,111 +145,189 @@ def load_wells() -> List[Dict[str, str]]:
 # WEB SCRAPING - JAVASCRIPT ARRAY PARSER
 # =============================================================================
 
-def scrape_well_data(torzsszam: str, nev: str) -> List[Dict[str, str]]:
+def reading_hour(timestamp_full: str) -> int:
+    """Óra kinyerése a "2024-11-11 08:00:00.0000000" formátumú timestamp-ből"""
+    time_part = timestamp_full.split(' ')[1] if ' ' in timestamp_full else '00:00:00'
+    return int(time_part.split(':')[0])
+
+
+def parse_chart_view(html_content: str, nev: str, full_resolution: bool = False) -> List[Dict[str, str]]:
+    """
+    chartView([...],[...]) JavaScript hívás feldolgozása a kút HTML oldalából
+
+    Alapból csak a reggeli (07:00 / 08:00) méréseket tartja meg;
+    full_resolution=True esetén a teljes órás idősort.
+
+    Returns:
+        List of dicts: [{"timestamp": "2024-11-11 08:00:00.0000000", "vizszint": "6.16"}, ...]
+    """
+    # JavaScript array-ek keresése
+    # chartView() hívás két array-vel: [vízszintek], [dátumok]
+    # Példa: chartView(["616","617",...],["2024-11-11 04:00:00.0000000",...])
+
+    # Keressük meg a chartView hívást
+    chart_start = html_content.find('chartView(')
+    if chart_start == -1:
+        logger.warning(f"   ⚠️  {nev}: chartView() nem található a HTML-ben")
+        return []
+
+    # Keressük meg a záró zárójelet - figyelünk a beágyazott zárójelekre
+    bracket_count = 0
+    chart_end = -1
+    for i in range(chart_start + 10, len(html_content)):
+        if html_content[i] == '(':
+            bracket_count += 1
+        elif html_content[i] == ')':
+            if bracket_count == 0:
+                chart_end = i
+                break
+            bracket_count -= 1
+
+    if chart_end == -1:
+        logger.warning(f"   ⚠️  {nev}: chartView() záró zárójele nem található")
+        return []
+
+    # Kinyerjük a chartView argumentumait
+    chart_call = html_content[chart_start + 10:chart_end]  # "chartView(".length = 10
+
+    # Kettévágás a középső "],["  mentén
+    split_pattern = r'\],\['
+    parts = re.split(split_pattern, chart_call, maxsplit=1)
+
+    if len(parts) != 2:
+        logger.warning(f"   ⚠️  {nev}: chartView() nem tartalmaz két array-t")
+        return []
+
+    # Az első array
+    water_levels_str = parts[0].lstrip('[')
+
+    # A második array: megkeressük a záró ] jelet
+    # (mert chartView-nak több mint 2 paramétere van)
+    second_array_end = parts[1].find(']')
+    if second_array_end == -1:
+        logger.warning(f"   ⚠️  {nev}: Második array záró ] nem található")
+        return []
+
+    timestamps_str = parts[1][:second_array_end]
+
+    # String → lista konverzió (JSON parse)
+    try:
+        water_levels = json.loads(f"[{water_levels_str}]")
+        timestamps = json.loads(f"[{timestamps_str}]")
+    except json.JSONDecodeError as e:
+        logger.error(f"   ❌ {nev}: JSON parse hiba - {e}")
+        return []
+
+    if len(water_levels) != len(timestamps):
+        logger.warning(f"   ⚠️  {nev}: Eltérő array hosszok ({len(water_levels)} vs {len(timestamps)})")
+        return []
+
+    measurements = []
+    for i in range(len(water_levels)):
+        try:
+            # Vízszint: cm → méter
+            water_level_cm = int(water_levels[i])
+            water_level_m = water_level_cm / 100.0
+
+            # Teljes timestamp: "2024-11-11 04:00:00.0000000"
+            timestamp_full = timestamps[i]
+
+            # CSAK REGGELI MÉRÉSEKET TARTJUK MEG (napi 1 mérés: 07:00 VAGY 08:00)
+            # Some wells measure at 07:00 (Mohács, Érsekcsanád, Kölked, Mohács II.)
+            # Others measure at 08:00 (Sátorhely, Dávod, etc.)
+            # Full-resolution módban minden órás mérés megmarad
+            hour = reading_hour(timestamp_full)
+            if not full_resolution and hour not in MORNING_HOURS:
+                continue
+
+            measurements.append({
+                "timestamp": timestamp_full,
+                "vizszint": f"{water_level_m:.2f}"
+            })
+        except (ValueError, IndexError) as e:
+            logger.debug(f"   ⏭️  {nev}: Adat skip ({i}. elem) - {e}")
+
+    return measurements
+
+
+def load_page_cache(torzsszam: str, cache_dir: str = HTTP_CACHE_DIR) -> Dict[str, str]:
+    """Kút oldalának HTTP cache bejegyzése (ETag, Last-Modified, tartalom hash)"""
+    try:
+        with open(os.path.join(cache_dir, f"{torzsszam}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_page_cache(torzsszam: str, entry: Dict[str, str], cache_dir: str = HTTP_CACHE_DIR):
+    """
+    HTTP cache bejegyzés mentése (atomikus csere)
+
+    Csak a mérések sikeres beszúrása után hívjuk, különben egy elveszett
+    futás adatait a következő alkalommal "változatlan" oldalként kihagynánk.
+    """
+    if not entry:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{torzsszam}.json")
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def scrape_well_data(
+    torzsszam: str,
+    nev: str,
+    page_cache: Optional[Dict[str, str]] = None,
+    full_resolution: bool = False
+) -> Optional[List[Dict[str, str]]]:
     """
     Egyetlen kút adatainak scraping-e a vizugy.hu-ról (JavaScript array parsing)
 
+    Ha `page_cache` meg van adva (load_page_cache() eredménye), feltételes
+    kérést küldünk (If-None-Match / If-Modified-Since), és a letöltött oldal
+    hash-ét összevetjük az előzővel. Változott oldal esetén a dict-et helyben
+    frissítjük az új ETag / Last-Modified / hash értékekkel - a hívó menti el
+    (save_page_cache) a sikeres beszúrás után.
+
     Returns:
-        List of dicts: [{"datum": "2025-11-06", "vizszint": "6.16"}, ...]
+        List of dicts: [{"timestamp": "2024-11-11 08:00:00.0000000", "vizszint": "6.16"}, ...]
+        vagy None, ha az oldal nem változott (304 vagy azonos hash)
     """
-    url = f"https://www.vizugy.hu/talajvizkut_grafikon/index.php?torzsszam={torzsszam}"
+    url = f"{VIZUGY_BASE_URL}/talajvizkut_grafikon/index.php?torzsszam={torzsszam}"
+
+    headers = {}
+    if page_cache:
+        if page_cache.get("etag"):
+            headers["If-None-Match"] = page_cache["etag"]
+        if page_cache.get("last_modified"):
+            headers["If-Modified-Since"] = page_cache["last_modified"]
 
     try:
         logger.info(f"🔍 {nev} (#{torzsszam}) scraping...")
-        response = requests.get(url, timeout=15)
+        response = get_client().get(url, headers=headers, timeout=15)
+
+        if response.status_code == 304:
+            logger.info(f"   💤 {nev}: nem változott (304 Not Modified)")
+            return None
+
         response.raise_for_status()
 
-        html_content = response.text
-
-        # JavaScript array-ek keresése
-        # chartView() hívás két array-vel: [vízszintek], [dátumok]
-        # Példa: chartView(["616","617",...],["2024-11-11 04:00:00.0000000",...])
-
-        # Keressük meg a chartView hívást
-        chart_start = html_content.find('chartView(')
-        if chart_start == -1:
-            logger.warning(f"   ⚠️  {nev}: chartView() nem található a HTML-ben")
-            return []
-
-        # Keressük meg a záró zárójelet - figyelünk a beágyazott zárójelekre
-        bracket_count = 0
-        chart_end = -1
-        for i in range(chart_start + 10, len(html_content)):
-            if html_content[i] == '(':
-                bracket_count += 1
-            elif html_content[i] == ')':
-                if bracket_count == 0:
-                    chart_end = i
-                    break
-                bracket_count -= 1
-
-        if chart_end == -1:
-            logger.warning(f"   ⚠️  {nev}: chartView() záró zárójele nem található")
-            return []
-
-        # Kinyerjük a chartView argumentumait
-        chart_call = html_content[chart_start + 10:chart_end]  # "chartView(".length = 10
-
-        # Kettévágás a középső "],["  mentén
-        split_pattern = r'\],\['
-        parts = re.split(split_pattern, chart_call, maxsplit=1)
-
-        if len(parts) != 2:
-            logger.warning(f"   ⚠️  {nev}: chartView() nem tartalmaz két array-t")
-            return []
-
-        # Az első array
-        water_levels_str = parts[0].lstrip('[')
-
-        # A második array: megkeressük a záró ] jelet
-        # (mert chartView-nak több mint 2 paramétere van)
-        second_array_end = parts[1].find(']')
-        if second_array_end == -1:
-            logger.warning(f"   ⚠️  {nev}: Második array záró ] nem található")
-            return []
-
-        timestamps_str = parts[1][:second_array_end]
-
-        # String → lista konverzió (JSON parse)
-        try:
-            water_levels = json.loads(f"[{water_levels_str}]")
-            timestamps = json.loads(f"[{timestamps_str}]")
-        except json.JSONDecodeError as e:
-            logger.error(f"   ❌ {nev}: JSON parse hiba - {e}")
-            return []
-
-        if len(water_levels) != len(timestamps):
-            logger.warning(f"   ⚠️  {nev}: Eltérő array hosszok ({len(water_levels)} vs {len(timestamps)})")
-            return []
-
-        measurements = []
-        for i in range(len(water_levels)):
-            try:
-                # Vízszint: cm → méter
-                water_level_cm = int(water_levels[i])
-                water_level_m = water_level_cm / 100.0
-
-                # Teljes timestamp: "2024-11-11 04:00:00.0000000"
-                timestamp_full = timestamps[i]
-
-                # CSAK REGGELI MÉRÉSEKET TARTJUK MEG (napi 1 mérés: 07:00 VAGY 08:00)
-                # Parse hour from timestamp
-                time_part = timestamp_full.split(' ')[1] if ' ' in timestamp_full else '00:00:00'
-                hour = int(time_part.split(':')[0])
-
-                # Skip if not morning measurement (07:00 or 08:00)
-                # Some wells measure at 07:00 (Mohács, Érsekcsanád, Kölked, Mohács II.)
-                # Others measure at 08:00 (Sátorhely, Dávod, etc.)
-                if hour not in [7, 8]:
-                    continue
+        if page_cache is not None:
+            content_hash = hashlib.sha256(response.content).hexdigest()
+            if content_hash == page_cache.get("sha256"):
+                logger.info(f"   💤 {nev}: nem változott (azonos tartalom hash)")
+                return None
 
-                measurements.append({
-                    "timestamp": timestamp_full,
-                    "vizszint": f"{water_level_m:.2f}"
-                })
-            except (ValueError, IndexError) as e:
-                logger.debug(f"   ⏭️  {nev}: Adat skip ({i}. elem) - {e}")
+            page_cache.update({
+                "etag": response.headers.get("ETag", ""),
+                "last_modified": response.headers.get("Last-Modified", ""),
+                "sha256": content_hash,
+                "fetched_at": datetime.now().isoformat(timespec="seconds")
+            })
 
+        measurements = parse_chart_view(response.text, nev, full_resolution)
         logger.info(f"   ✅ {len(measurements)} mérés találva")
         return measurements
 
@@ -217,173 +341,1139 @@ def scrape_well_data(torzsszam: str, nev: str) -> List[Dict[str, str]]:
         logger.error(f"   ❌ Scraping hiba {nev}: {e}")
         return []
 
+# =============================================================================
+# FULL-RESOLUTION: NAPI ÖSSZESÍTŐK
+# =============================================================================
+
+def split_full_resolution(
+    hourly: List[Dict[str, str]]
+) -> Tuple[List[Dict[str, str]], List[Dict]]:
+    """
+    Órás idősor feldolgozása egyetlen menetben
+
+    Egyszerre választja le a reggeli méréseket (a groundwater_data táblába,
+    ahogy eddig) és számolja a napi min / max / átlag / utolsó értékeket.
+    Naponta csak futó összegeket tartunk, az órás listát nem másoljuk.
+
+    A vizugy.hu oldal gördülő ablak, ami napközben kezdődik (pl. 04:00-tól):
+    a legrégebbi nap csonka, ezért arra nem készül összesítő - különben
+    felülírná a korábbi futásokban tárolt teljes napi sort.
+
+    Returns:
+        (reggeli mérések, napi összesítők dátum szerint rendezve)
+    """
+    morning: List[Dict[str, str]] = []
+    days: Dict[str, Dict] = {}
+
+    for m in hourly:
+        timestamp_full = m["timestamp"]
+        level = float(m["vizszint"])
+        day = timestamp_full[:10]
+
+        if reading_hour(timestamp_full) in MORNING_HOURS:
+            morning.append(m)
+
+        acc = days.get(day)
+        if acc is None:
+            days[day] = {
+                "date": day, "min": level, "max": level, "sum": level, "count": 1,
+                "last": level, "last_timestamp": timestamp_full, "first_timestamp": timestamp_full
+            }
+            continue
+
+        acc["min"] = min(acc["min"], level)
+        acc["max"] = max(acc["max"], level)
+        acc["sum"] += level
+        acc["count"] += 1
+        if timestamp_full >= acc["last_timestamp"]:
+            acc["last"] = level
+            acc["last_timestamp"] = timestamp_full
+        acc["first_timestamp"] = min(acc["first_timestamp"], timestamp_full)
+
+    # Csonka első nap (az ablak éjfél után kezdődik) kihagyása
+    if days:
+        first_day = min(days)
+        if reading_hour(days[first_day]["first_timestamp"]) > 0:
+            del days[first_day]
+
+    rollups = [
+        {
+            "date": acc["date"],
+            "min": f"{acc['min']:.2f}",
+            "max": f"{acc['max']:.2f}",
+            "mean": f"{acc['sum'] / acc['count']:.2f}",
+            "last": f"{acc['last']:.2f}",
+            "last_timestamp": acc["last_timestamp"],
+            "count": acc["count"]
+        }
+        for acc in sorted(days.values(), key=lambda a: a["date"])
+    ]
+    return morning, rollups
+
 # =============================================================================
 # SUPABASE MŰVELETEK
 # =============================================================================
 
-def get_well_id(supabase: Client, torzsszam: str) -> Optional[str]:
-    """Kút UUID lekérése a well_code alapján"""
+def to_iso_timestamp(timestamp_str: str) -> str:
+    """Timestamp konverzió ISO 8601-re ("2024-11-11 04:00:00.0000000" → "2024-11-11T04:00:00Z")"""
+    timestamp_clean = timestamp_str.split('.')[0]
+    dt = datetime.strptime(timestamp_clean, "%Y-%m-%d %H:%M:%S")
+    return dt.isoformat() + "Z"
+
+def lookup_well_id(supabase: Client, torzsszam: str) -> Tuple[Optional[str], bool]:
+    """
+    Kút UUID lekérése a well_code alapján, a "nincs ilyen kút" és a
+    lekérdezési hiba (pl. Supabase kiesés) megkülönböztetésével
+
+    Returns:
+        (UUID, True) ha megvan; (None, False) ha a kút nincs a táblában;
+        (None, True) lekérdezési hiba esetén (a kút létezhet, később újrapróbálható)
+    """
     try:
-        response = supabase.table("groundwater_wells").select("id").eq("well_code", torzsszam).single().execute()
-        return response.data["id"] if response.data else None
+        response = supabase.table("groundwater_wells").select("id").eq("well_code", torzsszam).limit(1).execute()
     except Exception as e:
+        if getattr(e, "code", None) == "PGRST116":  # PostgREST: 0 sor
+            return None, False
         logger.error(f"❌ Kút ID lekérési hiba (#{torzsszam}): {e}")
+        return None, True
+    if not response.data:
+        return None, False
+    return response.data[0]["id"], True
+
+
+def get_well_id(supabase: Client, torzsszam: str) -> Optional[str]:
+    """Kút UUID lekérése a well_code alapján (None, ha nem található vagy hiba történt)"""
+    return lookup_well_id(supabase, torzsszam)[0]
+
+# =============================================================================
+# WRITE-AHEAD JOURNAL (SUPABASE KIESÉS ELLEN)
+# =============================================================================
+
+def journal_batch(
+    table: str,
+    rows: List[Dict],
+    torzsszam: str,
+    well_name: str,
+    on_conflict: str,
+    ignore_duplicates: bool = True
+) -> str:
+    """
+    Feldolgozott köteg mentése a helyi journal-ba, MIELŐTT Supabase-be írnánk
+
+    Egy köteg = egy JSON fájl (data/journal/), atomikus cserével és fsync-kel
+    írva. A sorokban nincs well_id: azt a beszúráskor oldjuk fel, így a kút
+    ID lekérése is eshet a kiesés idejére.
+
+    Returns:
+        A journal fájl útvonala
+    """
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    entry = {
+        "table": table,
+        "on_conflict": on_conflict,
+        "ignore_duplicates": ignore_duplicates,
+        "torzsszam": torzsszam,
+        "well_name": well_name,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "rows": rows
+    }
+    name = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{torzsszam}_{table}_{os.getpid()}.json"
+    path = os.path.join(JOURNAL_DIR, name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def claim_journal_entry(path: str) -> Optional[str]:
+    """
+    Journal köteg lefoglalása ehhez a folyamathoz (atomikus átnevezés)
+
+    Egy cron futás, egy kézi --replay-journal / --backfill és egy másik folyamat
+    induló visszajátszása ugyanazt a köteget is megpróbálhatja beírni: az
+    átnevezés közülük pontosan egynek sikerül.
+
+    Returns:
+        A lefoglalt fájl útvonala, vagy None ha a köteg már eltűnt (másik
+        folyamat lefoglalta vagy nyugtázta)
+    """
+    claimed = f"{path}.claimed.{os.getpid()}"
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
         return None
+    return claimed
+
+
+def release_journal_entry(claimed: str, path: str):
+    """Lefoglalt köteg visszaadása a függő kötegek közé (nem sikerült beírni)"""
+    try:
+        os.replace(claimed, path)
+    except OSError as e:
+        logger.error(f"   ❌ Journal köteg visszaadása sikertelen: {claimed} ({e})")
+
+
+def recover_stale_claims():
+    """Leállt (már nem futó) folyamatok által lefoglalt kötegek visszaadása"""
+    try:
+        names = os.listdir(JOURNAL_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        base, sep, pid = name.rpartition(".claimed.")
+        if not sep or not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            os.kill(int(pid), 0)
+            continue  # a folyamat még fut
+        except ProcessLookupError:
+            pass
+        except (PermissionError, OSError):
+            continue
+        claimed = os.path.join(JOURNAL_DIR, name)
+        try:
+            os.rename(claimed, os.path.join(JOURNAL_DIR, base))
+            logger.warning(f"   ⚠️  Leállt folyamat (pid {pid}) journal kötege visszaadva: {base}")
+        except FileNotFoundError:
+            pass
+
+
+def commit_journal_entry(supabase: Client, path: str, well_id: Optional[str] = None) -> Optional[int]:
+    """
+    Egy journal köteg beírása Supabase-be, majd törlése a journal-ból
+
+    Kötegelt upsert (SUPABASE_BATCH_SIZE soronként). Újrapróbálás esetén a
+    már beírt sorok az on_conflict miatt nem duplikálódnak. A köteget előbb
+    lefoglalja (claim_journal_entry); ha közben másik folyamat vitte el,
+    nyugtázottnak tekinti.
+
+    Returns:
+        Beszúrt / upsert-elt sorok száma (0, ha másik folyamat foglalta le),
+        vagy None ha Supabase nem nyugtázta (a köteg a journal-ban marad)
+    """
+    claimed = claim_journal_entry(path)
+    if claimed is None:
+        logger.info(f"   📒 Journal köteg már feldolgozva (másik folyamat): {os.path.basename(path)}")
+        return 0
+
+    written = None
+    try:
+        with open(claimed, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+
+        well_name = entry.get("well_name", entry["torzsszam"])
+        if well_id is None:
+            well_id = get_well_id(supabase, entry["torzsszam"])
+            if not well_id:
+                return None
+
+        rows = [{"well_id": well_id, **row} for row in entry["rows"]]
+        count = 0
+        for start in range(0, len(rows), SUPABASE_BATCH_SIZE):
+            try:
+                response = supabase.table(entry["table"]).upsert(
+                    rows[start:start + SUPABASE_BATCH_SIZE],
+                    on_conflict=entry["on_conflict"],
+                    ignore_duplicates=entry["ignore_duplicates"]
+                ).execute()
+                count += len(response.data or [])
+            except Exception as e:
+                logger.error(f"   ❌ {well_name}: {entry['table']} köteg nem nyugtázva, journal-ban marad ({str(e)[:80]})")
+                return None
+        written = count
+    finally:
+        if written is None:
+            release_journal_entry(claimed, path)
+
+    os.remove(claimed)
+    return written
+
+
+def reject_journal_entry(path: str, reason: str):
+    """
+    Beírhatatlan köteg áthelyezése a data/journal/rejected/ mappába
+
+    Nem töröljük (kézzel javítható, pl. a kút felvétele után visszamásolható),
+    de a függő kötegek közé már nem számít.
+    """
+    os.makedirs(JOURNAL_REJECTED_DIR, exist_ok=True)
+    try:
+        os.rename(path, os.path.join(JOURNAL_REJECTED_DIR, os.path.basename(path)))
+    except FileNotFoundError:
+        return  # közben másik folyamat lefoglalta / félretette
+    logger.error(f"   ❌ Journal köteg félretéve ({reason}): {JOURNAL_REJECTED_DIR}/{os.path.basename(path)}")
+
+
+def pending_journal_entries() -> List[str]:
+    """Még nem nyugtázott journal kötegek, létrehozási sorrendben"""
+    recover_stale_claims()
+    try:
+        names = sorted(n for n in os.listdir(JOURNAL_DIR) if n.endswith(".json"))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(JOURNAL_DIR, n) for n in names]
+
+
+def replay_journal(supabase: Client) -> Tuple[int, int]:
+    """
+    Journal kiürítése: minden függő köteg újrapróbálása
+
+    Returns:
+        (nyugtázott kötegek száma, journal-ban maradt kötegek száma)
+    """
+    paths = pending_journal_entries()
+    if not paths:
+        return 0, 0
+
+    logger.info(f"📒 Journal: {len(paths)} függő köteg visszajátszása...")
+    well_ids: Dict[str, Tuple[Optional[str], bool]] = {}
+    acked = 0
+    rows_written = 0
+
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                torzsszam = json.load(f)["torzsszam"]
+        except FileNotFoundError:
+            continue  # közben másik folyamat lefoglalta / nyugtázta
+        except (OSError, json.JSONDecodeError, KeyError) as e:
+            logger.error(f"   ❌ Hibás journal fájl, kihagyva: {path} ({e})")
+            continue
+
+        if torzsszam not in well_ids:
+            well_ids[torzsszam] = lookup_well_id(supabase, torzsszam)
+        well_id, found = well_ids[torzsszam]
+
+        if not found:
+            # Soha nem fog sikerülni: félretesszük, hogy ne blokkolja a journal-t
+            reject_journal_entry(path, f"kút nem található az adatbázisban (#{torzsszam})")
+            continue
+        if not well_id:
+            continue
+
+        written = commit_journal_entry(supabase, path, well_id)
+        if written is not None:
+            acked += 1
+            rows_written += written
+
+    remaining = len(pending_journal_entries())
+    logger.info(f"📒 Journal: {acked} köteg nyugtázva ({rows_written} sor), {remaining} maradt")
+    return acked, remaining
+
+# =============================================================================
+# SUPABASE BESZÚRÁS (JOURNAL-ON KERESZTÜL)
+# =============================================================================
 
 def insert_measurements_to_supabase(
     supabase: Client,
-    well_id: str,
+    well_id: Optional[str],
     measurements: List[Dict[str, str]],
-    well_name: str
-) -> int:
+    well_name: str,
+    torzsszam: str
+) -> Optional[int]:
     """
     Mérések beszúrása Supabase-be (csak új adatok)
 
+    A köteg előbb a journal-ba kerül, és csak Supabase nyugtázása után
+    törlődik onnan. Ha a well_id nem ismert (pl. Supabase kiesés), csak
+    journal-ozunk.
+
     Returns:
-        Beszúrt rekordok száma
+        Beszúrt rekordok száma, vagy None ha a köteg a journal-ban maradt
     """
     if not measurements:
         return 0
 
-    new_count = 0
+    rows = [
+        {"water_level_meters": float(m["vizszint"]), "timestamp": to_iso_timestamp(m["timestamp"])}
+        for m in measurements
+    ]
+    path = journal_batch("groundwater_data", rows, torzsszam, well_name, "well_id,timestamp")
+    if not well_id:
+        return None
+    return commit_journal_entry(supabase, path, well_id)
 
-    for m in measurements:
-        try:
-            # Timestamp konverzió ISO 8601 formátumra
-            # m["timestamp"] = "2024-11-11 04:00:00.0000000" → "2024-11-11T04:00:00Z"
-            timestamp_str = m['timestamp']
-            # Parse the timestamp (remove microseconds for simplicity)
-            timestamp_parts = timestamp_str.split('.')
-            timestamp_clean = timestamp_parts[0]  # "2024-11-11 04:00:00"
-            # Convert to ISO format
-            from datetime import datetime
-            dt = datetime.strptime(timestamp_clean, "%Y-%m-%d %H:%M:%S")
-            timestamp_iso = dt.isoformat() + "Z"
-
-            # Beszúrás (upsert: conflict esetén ignore)
-            data = {
-                "well_id": well_id,
-                "water_level_meters": float(m["vizszint"]),
-                "timestamp": timestamp_iso
-            }
 
-            response = supabase.table("groundwater_data").insert(data).execute()
+def insert_hourly_to_supabase(
+    supabase: Client,
+    well_id: Optional[str],
+    hourly: List[Dict[str, str]],
+    well_name: str,
+    torzsszam: str
+) -> Optional[int]:
+    """
+    Órás (full-resolution) mérések beszúrása a groundwater_data_hourly táblába
+
+    Kötegelt upsert, a már meglévő (well_id, timestamp) párokat kihagyja.
 
-            if response.data:
-                new_count += 1
-                logger.debug(f"   ➕ {well_name}: {timestamp_iso} → {m['vizszint']}m beszúrva")
+    Returns:
+        Beszúrt rekordok száma, vagy None ha a köteg a journal-ban maradt
+    """
+    if not hourly:
+        return 0
 
-        except Exception as e:
-            # Duplikátum vagy egyéb hiba - csendben léptetünk
-            logger.debug(f"   ⏭️  {well_name}: {m.get('timestamp', 'N/A')} kihagyva ({str(e)[:50]})")
+    rows = [
+        {"water_level_meters": float(m["vizszint"]), "timestamp": to_iso_timestamp(m["timestamp"])}
+        for m in hourly
+    ]
+    path = journal_batch("groundwater_data_hourly", rows, torzsszam, well_name, "well_id,timestamp")
+    if not well_id:
+        return None
+    return commit_journal_entry(supabase, path, well_id)
+
+
+def upsert_daily_rollups(
+    supabase: Client,
+    well_id: Optional[str],
+    rollups: List[Dict],
+    well_name: str,
+    torzsszam: str
+) -> Optional[int]:
+    """
+    Napi összesítők upsert-je a groundwater_daily_rollups táblába
+
+    A mai nap sora minden futáskor felülíródik, ahogy új órás mérések érkeznek.
 
-    return new_count
+    Returns:
+        Upsert-elt sorok száma, vagy None ha a köteg a journal-ban maradt
+    """
+    if not rollups:
+        return 0
+
+    rows = [
+        {
+            "date": r["date"],
+            "min_level_meters": float(r["min"]),
+            "max_level_meters": float(r["max"]),
+            "mean_level_meters": float(r["mean"]),
+            "last_level_meters": float(r["last"]),
+            "last_timestamp": to_iso_timestamp(r["last_timestamp"]),
+            "sample_count": r["count"]
+        }
+        for r in rollups
+    ]
+    path = journal_batch("groundwater_daily_rollups", rows, torzsszam, well_name, "well_id,date",
+                         ignore_duplicates=False)
+    if not well_id:
+        return None
+    return commit_journal_entry(supabase, path, well_id)
 
 # =============================================================================
 # CSV BACKUP (OPCIONÁLIS)
 # =============================================================================
 
+CSV_BACKUP_COLUMNS = ["timestamp", "vizszint", "kut_nev", "torzsszam"]
+HOURLY_ARCHIVE_COLUMNS = ["timestamp", "vizszint", "kut_nev", "torzsszam"]
+ROLLUP_ARCHIVE_COLUMNS = ["date", "min", "max", "mean", "last", "last_timestamp", "count", "kut_nev", "torzsszam"]
+
+# Már kiírt sorok kulcsai fájlonként és kutanként: {(path, kulcs oszlopok): {torzsszam: {kulcs, ...}}}
+# Folyamatonként egyszer töltődik (preload_csv_keys), utána csak bővül.
+CSV_KEYS: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Set[str]]] = {}
+
+
+def csv_header(path: str) -> Optional[List[str]]:
+    """CSV fejléc (None, ha a fájl nem létezik vagy üres)"""
+    try:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            return next(csv.reader(f), None)
+    except FileNotFoundError:
+        return None
+
+
+def preload_csv_keys(path: str, key_cols: Tuple[str, ...], torzsszamok: Iterable[str]):
+    """
+    A megadott kutak már kiírt sorainak kulcsai egyetlen (oszlopszűrt, darabolt) olvasással
+
+    Shardonként egyszer hívjuk, így kútonként nem kell a teljes fájlt újraolvasni.
+    """
+    keys = CSV_KEYS.setdefault((path, key_cols), {})
+    loaded = {t: set() for t in torzsszamok if t not in keys}
+    if not loaded:
+        return
+
+    header = csv_header(path)
+    if header and "torzsszam" in header and all(c in header for c in key_cols):
+        for chunk in pd.read_csv(path, usecols=["torzsszam", *key_cols], dtype=str,
+                                 encoding="utf-8-sig", chunksize=200_000):
+            chunk = chunk[chunk["torzsszam"].isin(loaded.keys())].fillna("")
+            for t, *values in zip(chunk["torzsszam"], *(chunk[c] for c in key_cols)):
+                loaded[t].add("|".join(values))
+
+    # Csak sikeres olvasás után: hiba esetén a következő hívás újrapróbálja
+    keys.update(loaded)
+
+
+def append_csv_rows(path: str, rows: List[Dict], columns: List[str], key_cols: Tuple[str, ...]) -> int:
+    """
+    Új sorok hozzáfűzése egy CSV fájlhoz, a fájl újraírása nélkül
+
+    A már kiírt (torzsszam, kulcs) párokat kihagyja. Hiba esetén kivételt dob,
+    hogy a hívó ne zárja le a kutat sikeresként.
+
+    Returns:
+        Hozzáfűzött sorok száma
+    """
+    if not rows:
+        return 0
+
+    preload_csv_keys(path, key_cols, {r["torzsszam"] for r in rows})
+    keys = CSV_KEYS[(path, key_cols)]
+
+    new_rows = []
+    for r in rows:
+        key = "|".join(str(r[c]) for c in key_cols)
+        if key not in keys[r["torzsszam"]]:
+            keys[r["torzsszam"]].add(key)
+            new_rows.append(r)
+    if not new_rows:
+        return 0
+
+    header = csv_header(path)
+    try:
+        if header is None:
+            # Új fájl: BOM + fejléc (Excel kompatibilis, mint eddig)
+            with open(path, "w", encoding="utf-8-sig", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerows([r.get(c, "") for c in columns] for r in new_rows)
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            with open(path, "a", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerows([r.get(c, "") for c in header] for r in new_rows)
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        # Ki nem írt sorok kulcsai ne maradjanak a cache-ben
+        for r in new_rows:
+            keys[r["torzsszam"]].discard("|".join(str(r[c]) for c in key_cols))
+        raise
+    return len(new_rows)
+
+
+def csv_backup_layout() -> Tuple[List[str], str]:
+    """
+    CSV backup oszlopai és idő oszlopa
+
+    Régebbi backup-okban (pl. a repóban lévő data/talajviz_adatok.csv) "datum"
+    oszlop van, csak a nappal; ilyenkor ebben a formában fűzünk hozzá.
+    """
+    header = csv_header(CSV_BACKUP_PATH)
+    if header and "timestamp" not in header and "datum" in header:
+        return header, "datum"
+    return CSV_BACKUP_COLUMNS, "timestamp"
+
+
 def save_to_csv_backup(
     measurements_by_well: Dict[str, List[Dict[str, str]]],
     kutak: List[Dict[str, str]]
-):
-    """CSV backup mentése (append mode)"""
+) -> bool:
+    """
+    CSV backup mentése (append mode, duplikátum szűréssel)
+
+    Returns:
+        True ha sikerült (vagy nem volt új adat), False hiba esetén
+    """
     try:
-        # Meglévő CSV betöltése
-        try:
-            existing = pd.read_csv(CSV_BACKUP_PATH)
-        except FileNotFoundError:
-            existing = pd.DataFrame(columns=["timestamp", "vizszint", "kut_nev", "torzsszam"])
-
-        # Új adatok előkészítése
-        new_rows = []
-        for kut in kutak:
-            torzsszam = kut["torzsszam"]
-            nev = kut["nev"]
-
-            for m in measurements_by_well.get(torzsszam, []):
-                # Duplikátum ellenőrzés
-                is_duplicate = ((existing["timestamp"] == m["timestamp"]) &
-                               (existing["torzsszam"] == torzsszam)).any()
-
-                if not is_duplicate:
-                    new_rows.append({
-                        "timestamp": m["timestamp"],
-                        "vizszint": m["vizszint"],
-                        "kut_nev": nev,
-                        "torzsszam": torzsszam
-                    })
-
-        # Új adatok hozzáfűzése
-        if new_rows:
-            df_new = pd.DataFrame(new_rows)
-            df_all = pd.concat([existing, df_new], ignore_index=True)
-            df_all.to_csv(CSV_BACKUP_PATH, index=False, encoding="utf-8-sig")
-            logger.info(f"💾 {len(new_rows)} új rekord mentve CSV backup-ba: {CSV_BACKUP_PATH}")
+        columns, time_col = csv_backup_layout()
+        rows = [
+            {
+                time_col: m["timestamp"] if time_col == "timestamp" else m["timestamp"][:10],
+                "vizszint": m["vizszint"], "kut_nev": kut["nev"], "torzsszam": kut["torzsszam"]
+            }
+            for kut in kutak
+            for m in measurements_by_well.get(kut["torzsszam"], [])
+        ]
+        added = append_csv_rows(CSV_BACKUP_PATH, rows, columns, (time_col,))
+        if added:
+            logger.info(f"💾 {added} új rekord mentve CSV backup-ba: {CSV_BACKUP_PATH}")
         else:
             logger.info("💾 CSV backup: nincs új adat")
-
+        return True
     except Exception as e:
         logger.error(f"❌ CSV backup hiba: {e}")
+        return False
+
+
+def save_full_resolution_archive(
+    hourly_by_well: Dict[str, List[Dict[str, str]]],
+    rollups_by_well: Dict[str, List[Dict]],
+    kutak: List[Dict[str, str]]
+) -> bool:
+    """
+    Órás adatok és napi összesítők hozzáfűzése külön helyi archívumba
+
+    Órás: data/talajviz_orankenti.csv, napi: data/talajviz_napi_osszesito.csv.
+    A napi összesítő csak akkor kerül újra kiírásra, ha a mintaszáma változott
+    (a mai nap még bővül) - egy napra mindig a legutolsó sor az érvényes.
+
+    Returns:
+        True ha mindkét archívum írása sikerült
+    """
+    names = {k["torzsszam"]: k["nev"] for k in kutak}
+
+    archives = [
+        (HOURLY_ARCHIVE_PATH, hourly_by_well, HOURLY_ARCHIVE_COLUMNS, ("timestamp",)),
+        (ROLLUP_ARCHIVE_PATH, rollups_by_well, ROLLUP_ARCHIVE_COLUMNS, ("date", "count")),
+    ]
+    ok = True
+    for path, rows_by_well, columns, key_cols in archives:
+        try:
+            rows = [
+                {**row, "kut_nev": names.get(torzsszam, ""), "torzsszam": torzsszam}
+                for torzsszam, well_rows in rows_by_well.items()
+                for row in well_rows
+            ]
+            added = append_csv_rows(path, rows, columns, key_cols)
+            if added:
+                logger.info(f"💾 {added} sor archiválva: {path}")
+        except Exception as e:
+            logger.error(f"❌ Archiválási hiba ({path}): {e}")
+            ok = False
+    return ok
 
 # =============================================================================
-# FŐPROGRAM
+# CHECKPOINT (FOLYTATHATÓ FUTÁS)
 # =============================================================================
 
-def main():
-    """Főprogram: scraping + Supabase insert + CSV backup"""
-    logger.info("=" * 60)
-    logger.info("🌊 Talajvízkút Adatgyűjtő - INDULÁS")
-    logger.info(f"   Időpont: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    logger.info("=" * 60)
+def load_checkpoint(path: str = CHECKPOINT_PATH) -> Dict[str, Dict]:
+    """
+    Checkpoint betöltése (JSON Lines, csak hozzáfűzés)
+
+    Az első sor a futás fejléce ({"run_date": ...}), utána kútonként egy-egy
+    állapotsor ("scraped" / "committed" / "journaled" / "failed"). Kútonként a legutolsó
+    sor számít.
+
+    Returns:
+        {"__run__": fejléc, "<torzsszam>": utolsó állapotsor, ...}
+        vagy üres dict, ha nincs checkpoint
+    """
+    state: Dict[str, Dict] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Félbeszakadt írás (crash) - az utolsó sor csonka lehet
+                    logger.debug(f"   ⏭️  Checkpoint: hibás sor kihagyva ({line[:50]})")
+                    continue
+                if "run_date" in record:
+                    state["__run__"] = record
+                elif "torzsszam" in record:
+                    state[record["torzsszam"]] = record
+    except FileNotFoundError:
+        return {}
+    return state
+
+
+def append_checkpoint(record: Dict, path: str = CHECKPOINT_PATH):
+    """
+    Egy állapotsor hozzáfűzése a checkpoint-hoz
+
+    Több worker folyamat is írhatja egyszerre: minden sor egyetlen
+    O_APPEND írás, így a sorok nem keverednek össze.
+    """
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def start_checkpoint(path: str = CHECKPOINT_PATH, resume: bool = False, fresh: bool = False) -> Dict[str, Dict]:
+    """
+    Checkpoint előkészítése a futáshoz
+
+    A meglévő checkpoint-ot akkor folytatjuk, ha ugyanazon a napon indult
+    (pl. a reggeli cron futás összeomlott és kézzel újraindítjuk), vagy ha
+    --resume-mal kifejezetten kérik. Egyébként új futást kezdünk.
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    state = {} if fresh else load_checkpoint(path)
+    run = state.get("__run__")
+
+    if run and (resume or run.get("run_date") == today):
+        committed = sum(1 for k, v in state.items() if k != "__run__" and v.get("status") in DONE_STATUSES)
+        logger.info(f"♻️  Checkpoint folytatása ({run.get('run_started')}): {committed} kút már kész")
+        return state
+
+    if run:
+        logger.info(f"🧹 Régi checkpoint ({run.get('run_date')}) eldobva - új futás")
+
+    with open(path, "w", encoding="utf-8") as f:
+        header = {"run_date": today, "run_started": datetime.now().isoformat(timespec="seconds")}
+        f.write(json.dumps(header) + "\n")
+    return {}
 
-    # 1. Supabase inicializálás
+
+def clear_checkpoint(path: str = CHECKPOINT_PATH):
+    """Checkpoint törlése sikeres (teljes) futás után"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# =============================================================================
+# SHARDOLT FUTTATÁS (TÖBB FOLYAMAT)
+# =============================================================================
+
+def split_into_shards(kutak: List[Dict[str, str]], workers: int) -> List[List[Dict[str, str]]]:
+    """Kútlista felosztása `workers` darab shardra (round-robin, kiegyenlített)"""
+    workers = max(1, min(workers, len(kutak)))
+    return [kutak[i::workers] for i in range(workers)]
+
+
+def process_well(supabase: Client, kut: Dict[str, str], args: argparse.Namespace) -> Dict:
+    """
+    Egy kút teljes feldolgozása: scraping → Supabase insert → CSV backup → checkpoint
+
+    Returns:
+        {"torzsszam", "status", "scraped", "inserted", "hourly", "rollups"} - csak darabszámok,
+        hogy a pool ne küldje vissza (és a szülő folyamat ne tartsa memóriában) az adatsorokat
+        status: "committed" | "journaled" (Supabase nem nyugtázta) | "failed"
+    """
+    torzsszam, nev = kut["torzsszam"], kut["nev"]
+    result = {"torzsszam": torzsszam, "status": "failed", "scraped": 0, "inserted": 0, "hourly": 0, "rollups": 0}
+
+    page_cache = None
+    if not args.no_http_cache:
+        page_cache = load_page_cache(torzsszam)
+        if page_cache and page_cache.get("full_resolution", False) != args.full_resolution:
+            # Másik módban készült bejegyzés - a mostani mód adatai még hiányozhatnak
+            page_cache = {}
+
+    measurements = scrape_well_data(torzsszam, nev, page_cache, args.full_resolution)
+
+    if measurements is None:
+        # Változatlan oldal: nincs mit beszúrni, a kút ezzel kész
+        result["status"] = "committed"
+        result["unchanged"] = True
+        append_checkpoint({"torzsszam": torzsszam, "status": "committed", "unchanged": True}, args.checkpoint)
+        return result
+
+    hourly, rollups = [], []
+    if args.full_resolution and measurements:
+        hourly = measurements
+        measurements, rollups = split_full_resolution(hourly)
+        result["hourly"], result["rollups"] = len(hourly), len(rollups)
+
+    result["scraped"] = len(measurements)
+
+    if not measurements:
+        append_checkpoint({"torzsszam": torzsszam, "status": "failed", "reason": "scrape"}, args.checkpoint)
+        return result
+
+    append_checkpoint({"torzsszam": torzsszam, "status": "scraped", "scraped": len(measurements)}, args.checkpoint)
+
+    well_id, found = lookup_well_id(supabase, torzsszam)
+    if not found:
+        # Konfigurációs hiba, nem kiesés: journal-ozni fölösleges, soha nem lenne beírható
+        logger.error(f"❌ {nev}: Kút nem található az adatbázisban (#{torzsszam})")
+        append_checkpoint({"torzsszam": torzsszam, "status": "failed", "reason": "well_not_found"}, args.checkpoint)
+        return result
+    if not well_id:
+        logger.warning(f"⚠️  {nev}: kút ID nem kérdezhető le (Supabase kiesés?) - journal-ba mentve")
+
+    # Minden köteg előbb a journal-ba kerül; None = Supabase nem nyugtázta
+    commits = [insert_measurements_to_supabase(supabase, well_id, measurements, nev, torzsszam)]
+    if args.full_resolution:
+        commits.append(insert_hourly_to_supabase(supabase, well_id, hourly, nev, torzsszam))
+        commits.append(upsert_daily_rollups(supabase, well_id, rollups, nev, torzsszam))
+
+    inserted = commits[0] or 0
+    if inserted > 0:
+        logger.info(f"   ✅ {nev}: {inserted} új mérés beszúrva Supabase-be")
+    if args.full_resolution:
+        logger.info(f"   📈 {nev}: {commits[1] or 0} új órás mérés, {commits[2] or 0} napi összesítő")
+
+    # CSV backup kútonként (hozzáfűzés), a checkpoint lezárása előtt: egy félbeszakadt
+    # futás után --resume-mal kihagyott kutak adata így már a backup-ban van
+    with CSV_LOCK or nullcontext():
+        saved = save_to_csv_backup({torzsszam: measurements}, [kut])
+        if args.full_resolution:
+            saved = save_full_resolution_archive({torzsszam: hourly}, {torzsszam: rollups}, [kut]) and saved
+    if not saved:
+        # Page cache sem frissül: a következő futás újra letölti és kiírja
+        append_checkpoint({"torzsszam": torzsszam, "status": "failed", "reason": "csv_backup"}, args.checkpoint)
+        return result
+
+    # Journal-ban maradt adat is biztonságban van: nem kell újra scrapelni
+    if page_cache is not None:
+        page_cache["full_resolution"] = args.full_resolution
+        save_page_cache(torzsszam, page_cache)
+
+    status = "committed" if all(c is not None for c in commits) else "journaled"
+    result["status"] = status
+    result["inserted"] = inserted
+    append_checkpoint({
+        "torzsszam": torzsszam,
+        "status": status,
+        "scraped": len(measurements),
+        "inserted": inserted,
+        "at": datetime.now().isoformat(timespec="seconds")
+    }, args.checkpoint)
+    return result
+
+
+# A CSV backup / archívum írását sorosítja a worker folyamatok között (init_worker állítja be)
+CSV_LOCK = None
+
+
+def init_worker(csv_lock):
+    """Pool worker inicializálás: közös zár a CSV fájlokhoz"""
+    global CSV_LOCK
+    CSV_LOCK = csv_lock
+
+
+def run_shard(shard: List[Dict[str, str]], args: argparse.Namespace) -> List[Dict]:
+    """
+    Egy shard feldolgozása (worker folyamat belépési pontja)
+
+    Minden worker saját Supabase klienst nyit, mert a kliens nem
+    osztható meg folyamatok között.
+    """
     supabase = init_supabase()
     if not supabase:
-        logger.error("❌ Supabase nem elérhető - kilépés")
-        sys.exit(1)
+        return [{"torzsszam": k["torzsszam"], "status": "failed", "scraped": 0, "inserted": 0,
+                 "hourly": 0, "rollups": 0}
+                for k in shard]
 
-    # 2. Kútlista betöltése
-    kutak = load_wells()
+    # A shard kutjainak már kiírt CSV kulcsai egyszerre (nem kútonként újraolvasva).
+    # Hiba esetén az append kútonként újrapróbálja, és a kút sikertelen lesz.
+    torzsszamok = [k["torzsszam"] for k in shard]
+    try:
+        preload_csv_keys(CSV_BACKUP_PATH, (csv_backup_layout()[1],), torzsszamok)
+        if args.full_resolution:
+            preload_csv_keys(HOURLY_ARCHIVE_PATH, ("timestamp",), torzsszamok)
+            preload_csv_keys(ROLLUP_ARCHIVE_PATH, ("date", "count"), torzsszamok)
+    except Exception as e:
+        logger.warning(f"⚠️  CSV kulcsok előtöltése sikertelen: {e}")
 
-    # 3. Scraping mind a 15 kútra
-    measurements_by_well = {}
-    total_scraped = 0
+    return [process_well(supabase, kut, args) for kut in shard]
 
-    for kut in kutak:
-        measurements = scrape_well_data(kut["torzsszam"], kut["nev"])
-        measurements_by_well[kut["torzsszam"]] = measurements
-        total_scraped += len(measurements)
+# =============================================================================
+# BACKFILL (HÉZAGOK PÓTLÁSA)
+# =============================================================================
 
-    logger.info(f"📊 Összesen {total_scraped} mérés scrapolva {len(kutak)} kútból")
+def build_interval_index(dates: Iterable[date]) -> List[Tuple[date, date]]:
+    """
+    Tárolt napok összevonása összefüggő intervallumokká
 
-    # 4. Beszúrás Supabase-be
-    total_inserted = 0
+    Példa: {11-01, 11-02, 11-03, 11-07} → [(11-01, 11-03), (11-07, 11-07)]
+    """
+    intervals: List[Tuple[date, date]] = []
+    for d in sorted(set(dates)):
+        if intervals and d - intervals[-1][1] <= timedelta(days=1):
+            intervals[-1] = (intervals[-1][0], d)
+        else:
+            intervals.append((d, d))
+    return intervals
 
-    for kut in kutak:
-        well_id = get_well_id(supabase, kut["torzsszam"])
 
-        if not well_id:
-            logger.error(f"❌ {kut['nev']}: Kút nem található az adatbázisban (#{kut['torzsszam']})")
+def compute_gaps(intervals: List[Tuple[date, date]], start: date, end: date) -> List[Tuple[date, date]]:
+    """Hiányzó napok (zárt intervallumok) a [start, end] ablakban"""
+    gaps: List[Tuple[date, date]] = []
+    cursor = start
+    for first, last in intervals:
+        if last < cursor:
             continue
+        if first > end:
+            break
+        if first > cursor:
+            gaps.append((cursor, first - timedelta(days=1)))
+        cursor = max(cursor, last + timedelta(days=1))
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def fetch_stored_dates_supabase(supabase: Client, well_id: str, since: date) -> Optional[Set[date]]:
+    """
+    Egy kút Supabase-ben tárolt mérési napjai (lapozva, csak a timestamp oszlop)
+
+    Returns:
+        Napok halmaza, vagy None lekérdezési hiba esetén
+    """
+    stored: Set[date] = set()
+    page_size = SUPABASE_BATCH_SIZE
+    offset = 0
+    try:
+        while True:
+            response = (
+                supabase.table("groundwater_data")
+                .select("timestamp")
+                .eq("well_id", well_id)
+                .gte("timestamp", since.isoformat())
+                .order("timestamp")
+                .range(offset, offset + page_size - 1)
+                .execute()
+            )
+            rows = response.data or []
+            stored.update(date.fromisoformat(r["timestamp"][:10]) for r in rows)
+            if len(rows) < page_size:
+                return stored
+            offset += page_size
+    except Exception as e:
+        logger.error(f"❌ Tárolt napok lekérési hiba (well_id={well_id}): {e}")
+        return None
+
+
+def load_stored_dates_csv(path: str = CSV_BACKUP_PATH) -> Dict[str, Set[date]]:
+    """Tárolt mérési napok kútonként a helyi CSV backup-ból"""
+    try:
+        df = pd.read_csv(path, dtype=str)
+    except FileNotFoundError:
+        logger.warning(f"⚠️  CSV backup nem található: {path}")
+        return {}
+
+    # Régebbi backup-okban "datum" oszlop van "timestamp" helyett
+    time_col = "timestamp" if "timestamp" in df.columns else "datum"
+    df["nap"] = df[time_col].str[:10]
 
-        measurements = measurements_by_well.get(kut["torzsszam"], [])
-        inserted = insert_measurements_to_supabase(supabase, well_id, measurements, kut["nev"])
-        total_inserted += inserted
+    stored: Dict[str, Set[date]] = {}
+    for torzsszam, days in df.groupby("torzsszam")["nap"]:
+        stored[torzsszam] = {date.fromisoformat(d) for d in days.dropna().unique()}
+    return stored
 
-        if inserted > 0:
-            logger.info(f"   ✅ {kut['nev']}: {inserted} új mérés beszúrva Supabase-be")
 
+def backfill_well(
+    supabase: Client,
+    kut: Dict[str, str],
+    args: argparse.Namespace,
+    csv_dates: Optional[Dict[str, Set[date]]]
+) -> Dict:
+    """
+    Egy kút hézagainak pótlása
+
+    Csak akkor tölti le a kút oldalát, ha az ablakban van hiányzó nap, és
+    csak a hiányzó napok reggeli méréseit szúrja be (journal-on keresztül),
+    valamint fűzi a CSV backup-hoz.
+
+    Returns:
+        {"torzsszam", "status", "missing_days", "filled", "inserted"}
+    """
+    torzsszam, nev = kut["torzsszam"], kut["nev"]
+    result = {"torzsszam": torzsszam, "status": "failed", "missing_days": 0, "filled": 0, "inserted": 0}
+
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=args.backfill_days - 1)
+
+    well_id, found = lookup_well_id(supabase, torzsszam)
+    if not found:
+        logger.error(f"❌ {nev}: Kút nem található az adatbázisban (#{torzsszam})")
+        return result
+    if csv_dates is not None:
+        stored = csv_dates.get(torzsszam, set())
+    elif well_id:
+        stored = fetch_stored_dates_supabase(supabase, well_id, start)
+        if stored is None:
+            return result
+    else:
+        # Supabase forrásnál a tárolt napok lekérdezéséhez kell a kút ID
+        return result
+
+    gaps = compute_gaps(build_interval_index(stored), start, end)
+    missing = {start_day + timedelta(days=i)
+               for start_day, end_day in gaps
+               for i in range((end_day - start_day).days + 1)}
+    result["missing_days"] = len(missing)
+
+    if not missing:
+        logger.info(f"✅ {nev}: nincs hézag ({start} – {end})")
+        result["status"] = "committed"
+        return result
+
+    logger.info(f"🕳️  {nev}: {len(missing)} hiányzó nap {len(gaps)} hézagban")
+
+    measurements = scrape_well_data(torzsszam, nev)
+    if not measurements:
+        return result
+
+    fill = [m for m in measurements if date.fromisoformat(m["timestamp"][:10]) in missing]
+    result["filled"] = len({m["timestamp"][:10] for m in fill})
+    if not fill:
+        logger.info(f"   ⏭️  {nev}: a forrás oldalon sincs adat a hiányzó napokra")
+        result["status"] = "committed"
+        return result
+
+    inserted = insert_measurements_to_supabase(supabase, well_id, fill, nev, torzsszam)
+
+    # A pótolt napok a CSV backup-ba is: a --backfill-source csv különben újra hézagnak látná őket
+    with CSV_LOCK or nullcontext():
+        saved = save_to_csv_backup({torzsszam: fill}, [kut])
+
+    result["status"] = "failed" if not saved else "committed" if inserted is not None else "journaled"
+    result["inserted"] = inserted or 0
+    logger.info(f"   ✅ {nev}: {result['filled']} nap pótolva ({result['inserted']} új rekord)")
+    return result
+
+
+def run_backfill_shard(
+    shard: List[Dict[str, str]],
+    args: argparse.Namespace,
+    csv_dates: Optional[Dict[str, Set[date]]]
+) -> List[Dict]:
+    """Backfill egy shardra (worker folyamat belépési pontja)"""
+    supabase = init_supabase()
+    if not supabase:
+        return [{"torzsszam": k["torzsszam"], "status": "failed", "missing_days": 0, "filled": 0, "inserted": 0}
+                for k in shard]
+    try:
+        preload_csv_keys(CSV_BACKUP_PATH, (csv_backup_layout()[1],), [k["torzsszam"] for k in shard])
+    except Exception as e:
+        logger.warning(f"⚠️  CSV kulcsok előtöltése sikertelen: {e}")
+    return [backfill_well(supabase, kut, args, csv_dates) for kut in shard]
+
+
+def run_backfill(args: argparse.Namespace, kutak: List[Dict[str, str]]) -> List[Dict]:
+    """Hézagpótlás az összes kútra, kutak szerint párhuzamosítva"""
+    csv_dates = load_stored_dates_csv() if args.backfill_source == "csv" else None
+    shards = split_into_shards(kutak, args.workers) if kutak else []
+    results: List[Dict] = []
+
+    if len(shards) > 1:
+        with multiprocessing.Pool(processes=len(shards), initializer=init_worker,
+                                  initargs=(multiprocessing.Lock(),)) as pool:
+            for shard_results in pool.starmap(run_backfill_shard, [(shard, args, csv_dates) for shard in shards]):
+                results.extend(shard_results)
+    else:
+        for shard in shards:
+            results.extend(run_backfill_shard(shard, args, csv_dates))
+    return results
+
+# =============================================================================
+# FŐPROGRAM
+# =============================================================================
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parancssori argumentumok"""
+    parser = argparse.ArgumentParser(description="Talajvízkút adatgyűjtő (vizugy.hu → Supabase)")
+    parser.add_argument("--kutak", default=KUTAK_JSON,
+                        help=f"Kútkatalógus JSON fájl (alapértelmezett: {KUTAK_JSON})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Párhuzamos worker folyamatok száma (alapértelmezett: 1)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH,
+                        help=f"Checkpoint fájl (alapértelmezett: {CHECKPOINT_PATH})")
+    parser.add_argument("--no-http-cache", action="store_true",
+                        help="Feltételes kérés és tartalom hash kihagyás kikapcsolása (mindig teljes letöltés)")
+    parser.add_argument("--replay-journal", action="store_true",
+                        help="Csak a journal-ban függő kötegek beírása Supabase-be (scraping nélkül)")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Csak a hiányzó reggeli mérések pótlása (hézagkeresés a tárolt adatokban)")
+    parser.add_argument("--backfill-source", choices=["supabase", "csv"], default="supabase",
+                        help="Honnan olvassa a tárolt napokat a backfill (alapértelmezett: supabase)")
+    parser.add_argument("--backfill-days", type=int, default=BACKFILL_DAYS,
+                        help=f"Backfill ablak hossza napokban, tegnaptól visszafelé (alapértelmezett: {BACKFILL_DAYS})")
+    parser.add_argument("--full-resolution", action="store_true",
+                        help="Teljes órás idősor + napi min/max/átlag/utolsó összesítők mentése "
+                             "(groundwater_data_hourly, groundwater_daily_rollups)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--resume", action="store_true",
+                       help="Meglévő checkpoint folytatása akkor is, ha korábbi napon indult")
+    group.add_argument("--fresh", action="store_true",
+                       help="Checkpoint figyelmen kívül hagyása, teljes újrafuttatás")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Főprogram: scraping + Supabase insert + CSV backup"""
+    args = parse_args(argv)
+
+    logger.info("=" * 60)
+    logger.info("🌊 Talajvízkút Adatgyűjtő - INDULÁS")
+    logger.info(f"   Időpont: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info("=" * 60)
+
+    # 1. Supabase elérhetőség ellenőrzése (a workerek saját klienst nyitnak)
+    supabase = init_supabase()
+    if not supabase:
+        logger.error("❌ Supabase nem elérhető - kilépés")
+        sys.exit(1)
+
+    # Előző (kiesés alatti) futások függő kötegei
+    acked, remaining = replay_journal(supabase)
+    if args.replay_journal:
+        logger.info("=" * 60)
+        logger.info(f"📒 Journal visszajátszás kész: {acked} köteg nyugtázva, {remaining} maradt")
+        logger.info("=" * 60)
+        sys.exit(0 if remaining == 0 else 1)
+
+    # 2. Kútlista betöltése + checkpoint
+    kutak = load_wells(args.kutak)
+
+    if args.backfill:
+        results = run_backfill(args, kutak)
+        missing = sum(r["missing_days"] for r in results)
+        filled = sum(r["filled"] for r in results)
+        failed = [r["torzsszam"] for r in results if r["status"] not in DONE_STATUSES]
+        logger.info("=" * 60)
+        logger.info("🕳️  BACKFILL BEFEJEZVE" + (" HIBÁKKAL" if failed else ""))
+        logger.info(f"   Hiányzó nap: {missing}, pótolva: {filled}")
+        logger.info(f"   Beszúrva: {sum(r['inserted'] for r in results)} új rekord")
+        if failed:
+            logger.info(f"   Sikertelen kutak: {', '.join(failed)}")
+        logger.info("=" * 60)
+        sys.exit(1 if failed else 0)
+
+    state = start_checkpoint(args.checkpoint, resume=args.resume, fresh=args.fresh)
+
+    pending = [k for k in kutak if state.get(k["torzsszam"], {}).get("status") not in DONE_STATUSES]
+    skipped = len(kutak) - len(pending)
+    if skipped:
+        logger.info(f"⏭️  {skipped} kút kihagyva (checkpoint szerint már beszúrva)")
+
+    # 3-4. Scraping + beszúrás shardonként
+    shards = split_into_shards(pending, args.workers) if pending else []
+    results: List[Dict] = []
+
+    if len(shards) > 1:
+        logger.info(f"🧵 {len(pending)} kút feldolgozása {len(shards)} worker folyamattal")
+        with multiprocessing.Pool(processes=len(shards), initializer=init_worker,
+                                  initargs=(multiprocessing.Lock(),)) as pool:
+            for shard_results in pool.starmap(run_shard, [(shard, args) for shard in shards]):
+                results.extend(shard_results)
+    else:
+        for shard in shards:
+            results.extend(run_shard(shard, args))
+
+    total_scraped = sum(r["scraped"] for r in results)
+    total_inserted = sum(r["inserted"] for r in results)
+    unchanged = sum(1 for r in results if r.get("unchanged"))
+    journaled = sum(1 for r in results if r["status"] == "journaled")
+    failed = [r["torzsszam"] for r in results if r["status"] not in DONE_STATUSES]
+
+    logger.info(f"📊 Összesen {total_scraped} mérés scrapolva {len(results)} kútból")
+    if unchanged:
+        logger.info(f"💤 {unchanged} kút oldala nem változott (letöltés / feldolgozás kihagyva)")
     logger.info(f"✅ Supabase: {total_inserted} új rekord beszúrva")
+    if journaled:
+        logger.warning(f"📒 {journaled} kút adata a journal-ban vár Supabase-re ({JOURNAL_DIR}) - "
+                       f"visszajátszás: --replay-journal (vagy a következő futás elején automatikusan)")
+
+    # 5. CSV backup: kútonként, a process_well-ben (a checkpoint lezárása előtt) már megtörtént
 
-    # 5. CSV backup (opcionális)
-    save_to_csv_backup(measurements_by_well, kutak)
+    # 6. Checkpoint lezárása: csak teljes siker esetén töröljük
+    if failed:
+        logger.warning(f"⚠️  {len(failed)} kút sikertelen ({', '.join(failed)}) - "
+                       f"újrafuttatáskor a checkpoint-tól folytatódik: {args.checkpoint}")
+    else:
+        clear_checkpoint(args.checkpoint)
 
-    # 6. Összegzés
+    # 7. Összegzés
     logger.info("=" * 60)
-    logger.info("🎉 SIKERES BEFEJEZÉS")
+    logger.info("🎉 SIKERES BEFEJEZÉS" if not failed and not journaled else "⚠️  BEFEJEZVE HIBÁKKAL")
     logger.info(f"   Scrapolva: {total_scraped} mérés")
     logger.info(f"   Beszúrva: {total_inserted} új rekord")
+    if skipped:
+        logger.info(f"   Checkpoint-ból kihagyva: {skipped} kút")
     logger.info("=" * 60)
 
 if __name__ == "__main__":
@@ -1,9 +1,18 @@
-import requests
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+import argparse
+import hashlib
 import json
 import os
+import sys
+import tempfile
+
+# Közös HTTP kliens (kapcsolat-újrahasznosítás, hosztonkénti rate limit, retry/backoff)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "_shared"))
+from dunapp_http import get_client
 
 # --- Kútlista ---
 KUTAK = [
@@ -18,100 +27,355 @@ DAYS = 60
 # --- Mappák ---
 DATA_DIR = "output"
 CACHE_FILE = os.path.join(DATA_DIR, "cache_log.json")
-os.makedirs(DATA_DIR, exist_ok=True)
+CHART_DIR = os.path.join(DATA_DIR, "charts")
+RENDER_MANIFEST = os.path.join(CHART_DIR, "render_manifest.json")
+MAX_PLOT_POINTS = 1000
+API_URL = "https://vizadat.hu/api/v1/observations"
+TIMEOUT_SECONDS = 30
+
+
+# --- Segédfüggvények ---
+def write_json_atomic(path, data):
+    """JSON mentése ideiglenes fájlba, majd atomikus csere (félbeszakadt írás nem ronthatja el)."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.chmod(tmp_path, 0o644)  # mkstemp 0600-as jogosultsága helyett
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
 
-# --- Cache betöltés ---
-if os.path.exists(CACHE_FILE):
+
+def load_cache():
+    """
+    Cache napló betöltése.
+
+    Kútonként a már letöltött dátumtartomány: {"from": "...", "to": "...", "updated": "..."}.
+    A régi formátum (csak a frissítés napja) lefedettség nélkülinek számít.
+    """
+    if not os.path.exists(CACHE_FILE):
+        return {}
     with open(CACHE_FILE, "r", encoding="utf-8") as f:
         cache = json.load(f)
-else:
-    cache = {}
+    return {k: v for k, v in cache.items() if isinstance(v, dict)}
 
-today = datetime.now().strftime("%Y-%m-%d")
 
-# --- Fő ciklus ---
-all_data = []
+def missing_ranges(coverage, window_from, window_to):
+    """
+    A [window_from, window_to] ablakból hiányzó dátumtartományok.
 
-for site in KUTAK:
-    cache_key = site.replace(" ", "_")
-    last_update = cache.get(cache_key)
+    A lefedettség utolsó napját újra lekérjük, mert az napközben még bővülhetett.
+    """
+    if not coverage:
+        return [(window_from, window_to)]
 
-    # Ha már ma frissítve volt, ugrás
-    if last_update == today:
-        print(f"🟡 {site}: cache-ből töltve")
-        json_path = f"{DATA_DIR}/talajviz_{cache_key}.json"
-        if os.path.exists(json_path):
-            with open(json_path, "r", encoding="utf-8") as f:
-                site_data = json.load(f)
-                for rec in site_data:
-                    all_data.append({"kút": site, **rec})
-        continue
-
-    print(f"🔹 {site}: új lekérés...")
-
-    to_date = datetime.now()
-    from_date = to_date - timedelta(days=DAYS)
+    covered_from = datetime.strptime(coverage["from"], "%Y-%m-%d").date()
+    covered_to = datetime.strptime(coverage["to"], "%Y-%m-%d").date()
+
+    if covered_to < window_from or covered_from > window_to:
+        return [(window_from, window_to)]
+
+    ranges = []
+    if window_from < covered_from:
+        ranges.append((window_from, covered_from - timedelta(days=1)))
+    if covered_to <= window_to:
+        ranges.append((covered_to, window_to))
+    return ranges
+
+
+def fetch_range(site, from_date, to_date):
+    """Egy kút méréseinek lekérése a vizadat.hu API-ból a megadott napokra."""
     url = (
-        "https://vizadat.hu/api/v1/observations?"
+        f"{API_URL}?"
         f"site_name={site}&parameter={PARAM}"
         f"&from={from_date.strftime('%Y-%m-%d')}&to={to_date.strftime('%Y-%m-%d')}"
     )
+    response = get_client().get(url, timeout=TIMEOUT_SECONDS)
+    response.raise_for_status()
+    data = response.json()
+    return [
+        {"dátum": r.get("time"), "vízszint": r.get("value")}
+        for r in data.get("data", [])
+    ]
 
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
 
-        records = [
-            {"dátum": r.get("time"), "vízszint": r.get("value")}
-            for r in data.get("data", [])
-        ]
+def load_site_records(json_path):
+    """Kút cache-elt idősorának betöltése DataFrame-be."""
+    if not os.path.exists(json_path):
+        return pd.DataFrame(columns=["dátum", "vízszint"])
+    df = pd.read_json(json_path, orient="records")
+    if not df.empty:
+        df["dátum"] = pd.to_datetime(df["dátum"], utc=True)
+    return df
+
+
+def merge_records(df_old, new_records, window_from):
+    """
+    Új rekordok összefésülése a tárolt idősorral (dátum szerint, az új felülír), ablakra vágva.
+
+    Mindkét oldal UTC-re normalizálva: a cache "...Z" időbélyegeket tárol, az API
+    viszont +01:00 / +02:00 eltolással is adhat, és a vegyes oszlop nem hasonlítható.
+    """
+    df_new = pd.DataFrame(new_records, columns=["dátum", "vízszint"])
+    df_new["dátum"] = pd.to_datetime(df_new["dátum"], utc=True)
+    frames = [df for df in (df_old, df_new) if not df.empty]
+    if not frames:
+        return df_new
+    df = pd.concat(frames, ignore_index=True)
+    df = df.drop_duplicates(subset="dátum", keep="last").sort_values("dátum")
+    cutoff = pd.Timestamp(window_from, tz="UTC")
+    return df[df["dátum"] >= cutoff].reset_index(drop=True)
+
+
+def update_site(site, cache, today):
+    """
+    Egy kút cache-ének frissítése: csak a hiányzó napokat kéri le.
+
+    Returns:
+        A kút teljes (ablakra vágott) idősora DataFrame-ként, vagy None hiba / adathiány esetén
+    """
+    cache_key = site.replace(" ", "_")
+    json_path = f"{DATA_DIR}/talajviz_{cache_key}.json"
+    coverage = cache.get(cache_key) if os.path.exists(json_path) else None
+
+    # Ha már ma frissítve volt, ugrás
+    if coverage and coverage.get("updated") == today.isoformat():
+        print(f"🟡 {site}: cache-ből töltve")
+        df = load_site_records(json_path)
+        return df if not df.empty else None
+
+    window_from = today - timedelta(days=DAYS)
+    ranges = missing_ranges(coverage, window_from, today)
+    df = load_site_records(json_path) if coverage else pd.DataFrame(columns=["dátum", "vízszint"])
+
+    new_records = []
+    for from_date, to_date in ranges:
+        print(f"🔹 {site}: lekérés {from_date} – {to_date}...")
+        new_records.extend(fetch_range(site, from_date, to_date))
+
+    df = merge_records(df, new_records, window_from)
+    if df.empty:
+        print(f"⚠️  Nincs adat: {site}")
+        return None
+
+    # JSON export (atomikus csere)
+    write_json_atomic(json_path, json.loads(
+        df.to_json(orient="records", date_format="iso", force_ascii=False)
+    ))
+    print(f"   ✅ Mentve: {json_path} ({len(new_records)} új rekord)")
 
-        if not records:
-            print(f"⚠️  Nincs adat: {site}")
+    # Cache frissítés: a lefedett tartomány az ablak elejétől máig tart
+    cache[cache_key] = {
+        "from": window_from.isoformat(),
+        "to": today.isoformat(),
+        "updated": today.isoformat(),
+    }
+    write_json_atomic(CACHE_FILE, cache)
+    return df
+
+
+# --- Batch grafikon renderelés ---
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets lemintavételezés.
+
+    Az első és utolsó pontot megtartja, a köztes pontokat `threshold - 2` vödörbe
+    osztja, és vödrönként azt a pontot választja, amely az előzőleg kiválasztott
+    ponttal és a következő vödör átlagával a legnagyobb háromszöget adja.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    bucket_size = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+
+        # Következő vödör átlaga (az utolsó vödör után az utolsó pont)
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        if next_start >= next_end:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        else:
+            avg_x = x[next_start:next_end].mean()
+            avg_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    return x[selected], y[selected]
+
+
+def render_site_chart(site, json_path, formats, max_points):
+    """Egy kút grafikonjának renderelése fájlba (worker folyamatban, Agg backenddel)."""
+    plt.switch_backend("Agg")
+    df = load_site_records(json_path)
+    if df.empty:
+        return site, []
+
+    x = df["dátum"].dt.as_unit("ns").astype("int64").to_numpy(dtype=np.float64)
+    y = pd.to_numeric(df["vízszint"], errors="coerce").to_numpy(dtype=np.float64)
+    mask = ~np.isnan(y)
+    x, y = lttb(x[mask], y[mask], max_points)
+    dates = pd.to_datetime(x.astype(np.int64), unit="ns", utc=True)
+
+    fig, ax = plt.subplots(figsize=(10, 5))
+    ax.plot(dates, y, marker="o" if len(y) <= 120 else None)
+    ax.set_title(f"Talajvízszint – {site} (elmúlt {DAYS} nap)")
+    ax.set_xlabel("Dátum")
+    ax.set_ylabel("Vízszint")
+    ax.grid(True)
+    fig.tight_layout()
+
+    base = os.path.join(CHART_DIR, f"talajviz_{site.replace(' ', '_')}")
+    paths = []
+    for fmt in formats:
+        path = f"{base}.{fmt}"
+        fig.savefig(path, format=fmt)
+        paths.append(path)
+    plt.close(fig)
+    return site, paths
+
+
+def render_all_charts(sites, formats, workers, max_points):
+    """
+    Grafikonok renderelése minden kútra, párhuzamosan (process pool).
+
+    A kútfájl tartalmának hash-e a render_manifest.json-ba kerül; ha a cache-elt
+    adat (és a beállítás) nem változott, és a kimeneti fájlok megvannak, a kút kimarad.
+    """
+    os.makedirs(CHART_DIR, exist_ok=True)
+    manifest = {}
+    if os.path.exists(RENDER_MANIFEST):
+        with open(RENDER_MANIFEST, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    jobs = {}
+    for site in sites:
+        json_path = f"{DATA_DIR}/talajviz_{site.replace(' ', '_')}.json"
+        if not os.path.exists(json_path):
+            continue
+        with open(json_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        fingerprint = f"{digest}:{','.join(formats)}:{max_points}"
+        base = os.path.join(CHART_DIR, f"talajviz_{site.replace(' ', '_')}")
+        outputs_exist = all(os.path.exists(f"{base}.{fmt}") for fmt in formats)
+        if manifest.get(site) == fingerprint and outputs_exist:
+            print(f"🟡 {site}: grafikon változatlan, kihagyva")
             continue
+        jobs[site] = (json_path, fingerprint)
 
-        df = pd.DataFrame(records)
-        df["dátum"] = pd.to_datetime(df["dátum"])
-        df = df.sort_values("dátum")
+    if not jobs:
+        print("🖼️  Nincs újrarenderelendő grafikon.")
+        return
 
-        # JSON export
-        json_path = f"{DATA_DIR}/talajviz_{cache_key}.json"
-        df.to_json(json_path, orient="records", date_format="iso", force_ascii=False)
-        print(f"   ✅ Mentve: {json_path}")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            site: pool.submit(render_site_chart, site, json_path, formats, max_points)
+            for site, (json_path, _) in jobs.items()
+        }
+        for site, future in futures.items():
+            try:
+                _, paths = future.result()
+            except Exception as e:
+                print(f"❌ Renderelési hiba {site}: {e}")
+                continue
+            if paths:
+                manifest[site] = jobs[site][1]
+                print(f"   🖼️  {site}: {', '.join(paths)}")
 
-        # Cache frissítés
-        cache[cache_key] = today
+    write_json_atomic(RENDER_MANIFEST, manifest)
+    print(f"🖼️  {len(jobs)} grafikon renderelve: {CHART_DIR}")
 
-        # Összesítettbe
-        for rec in records:
-            all_data.append({"kút": site, **rec})
 
-    except Exception as e:
-        print(f"❌ Hiba {site}: {e}")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Talajvízkút adatgyűjtő (vizadat.hu, cache-elt)")
+    parser.add_argument("--render", action="store_true",
+                        help="Grafikonok renderelése fájlba minden kútra (headless, plt.show() nélkül)")
+    parser.add_argument("--formats", default="png",
+                        help="Kimeneti formátumok vesszővel elválasztva (pl. png,svg)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Renderelő folyamatok száma")
+    parser.add_argument("--max-points", type=int, default=MAX_PLOT_POINTS,
+                        help=f"LTTB lemintavételezés ennyi pontra (alapértelmezett: {MAX_PLOT_POINTS})")
+    return parser.parse_args(argv)
 
-# --- Cache mentés ---
-with open(CACHE_FILE, "w", encoding="utf-8") as f:
-    json.dump(cache, f, ensure_ascii=False, indent=2)
 
-# --- Összesített CSV ---
-if all_data:
-    df_all = pd.DataFrame(all_data)
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(DATA_DIR, exist_ok=True)
+    cache = load_cache()
+    today = datetime.now().date()
+
+    # --- Fő ciklus ---
+    # Minden kút sorai betöltés után azonnal az összesített CSV-be kerülnek
+    # (ideiglenes fájlba, a végén atomikus csere); a ciklus után csak a
+    # kútnevek és a mintagrafikon kútjának DataFrame-je marad meg.
+    sample_site = "Sátorhely"
+    df_sample = None
+    loaded_sites = []
     csv_path = os.path.join(DATA_DIR, "talajviz_osszes.csv")
-    df_all.to_csv(csv_path, index=False, encoding="utf-8-sig")
-    print(f"📁 Összesített fájl: {csv_path}")
-
-# --- Mintagrafikon ---
-sample_site = "Sátorhely"
-df_sample = pd.DataFrame([r for r in all_data if r["kút"] == sample_site])
-if not df_sample.empty:
-    plt.figure(figsize=(10, 5))
-    plt.plot(df_sample["dátum"], df_sample["vízszint"], marker="o")
-    plt.title(f"Talajvízszint – {sample_site} (elmúlt {DAYS} nap)")
-    plt.xlabel("Dátum")
-    plt.ylabel("Vízszint")
-    plt.grid(True)
-    plt.tight_layout()
-    plt.show()
-
-print("✅ Lekérések és cache frissítés befejezve.")
+    fd, tmp_csv_path = tempfile.mkstemp(dir=DATA_DIR, suffix=".csv.tmp")
+    rows_written = 0
+
+    with os.fdopen(fd, "w", encoding="utf-8-sig", newline="") as csv_file:
+        for site in KUTAK:
+            try:
+                df = update_site(site, cache, today)
+            except Exception as e:
+                print(f"❌ Hiba {site}: {e}")
+                continue
+            if df is None:
+                continue
+
+            # Összesítettbe
+            df.insert(0, "kút", site)
+            df.to_csv(csv_file, index=False, header=rows_written == 0)
+            rows_written += len(df)
+            loaded_sites.append(site)
+            if site == sample_site and not args.render:
+                df_sample = df
+
+    # --- Összesített CSV ---
+    if rows_written:
+        os.chmod(tmp_csv_path, 0o644)
+        os.replace(tmp_csv_path, csv_path)
+        print(f"📁 Összesített fájl: {csv_path} ({rows_written} sor)")
+    else:
+        os.remove(tmp_csv_path)
+
+    # --- Grafikonok (batch, headless) ---
+    if args.render:
+        formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+        render_all_charts(loaded_sites, formats, args.workers, args.max_points)
+        print("✅ Lekérések és cache frissítés befejezve.")
+        return
+
+    # --- Mintagrafikon ---
+    if df_sample is not None and not df_sample.empty:
+        plt.figure(figsize=(10, 5))
+        plt.plot(df_sample["dátum"], df_sample["vízszint"], marker="o")
+        plt.title(f"Talajvízszint – {sample_site} (elmúlt {DAYS} nap)")
+        plt.xlabel("Dátum")
+        plt.ylabel("Vízszint")
+        plt.grid(True)
+        plt.tight_layout()
+        plt.show()
+
+    print("✅ Lekérések és cache frissítés befejezve.")
+
+
+if __name__ == "__main__":
+    main()